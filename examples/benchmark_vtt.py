@@ -0,0 +1,76 @@
+"""
+Compares the speed of the streaming WebVTT parser (vtt.parse) with the
+older BeautifulSoup based one (vtt.parse_full) on a large file with word
+timestamps, like the auto-generated captions YouTube provides.
+
+If no file is given, a large file is made by repeating the cues of
+tests/test_inputs/manifesto.vtt.
+
+to run: python3 benchmark_vtt.py [SOMEFILE.vtt] [--repeat 200]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+from videogrep import vtt
+
+here = os.path.dirname(os.path.abspath(__file__))
+sample = os.path.join(here, "..", "tests", "test_inputs", "manifesto.vtt")
+
+
+def shift(match, offset):
+    secs = vtt.timestamp_to_secs(match.group(0)) + offset
+    m, s = divmod(secs, 60)
+    h, m = divmod(m, 60)
+    return "%02d:%02d:%06.3f" % (h, m, s)
+
+
+def make_large_file(filename, repeat):
+    with open(sample, encoding="utf8") as infile:
+        header, body = infile.read().split("\n\n", 1)
+
+    # the last timestamp in the sample
+    length = vtt.timestamp_to_secs(re.findall(r"\d\d:\d\d:\d\d\.\d+", body)[-1])
+
+    with open(filename, "w", encoding="utf8") as outfile:
+        outfile.write(header + "\n\n")
+        for i in range(repeat):
+            offset = i * length
+            outfile.write(
+                re.sub(r"\d\d:\d\d:\d\d\.\d+", lambda m: shift(m, offset), body)
+            )
+
+
+def benchmark(parser, filename):
+    started = time.perf_counter()
+    with open(filename, encoding="utf8") as infile:
+        out = parser(infile)
+    return time.perf_counter() - started, out
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("vttfile", nargs="?")
+parser.add_argument("--repeat", type=int, default=200)
+args = parser.parse_args()
+
+filename = args.vttfile
+if filename is None:
+    filename = os.path.join(tempfile.mkdtemp(), "large.vtt")
+    make_large_file(filename, args.repeat)
+
+size = os.path.getsize(filename) / 1024 / 1024
+print(f"{filename}: {size:.1f}mb")
+
+old_time, old = benchmark(vtt.parse_full, filename)
+new_time, new = benchmark(vtt.parse, filename)
+
+print(f"parse_full: {old_time:.3f}s ({len(old)} sentences)")
+print(f"parse:      {new_time:.3f}s ({len(new)} sentences)")
+print(f"speedup:    {old_time / new_time:.1f}x")
+
+if old != new:
+    print("Warning: the parsers gave different results")
+    sys.exit(1)
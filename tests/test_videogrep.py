@@ -1,11 +1,15 @@
 import videogrep
 import re
+import json
 from collections import Counter
 from pathlib import Path
 from moviepy.editor import VideoFileClip
 from pytest import approx
 import glob
+import os
+import shutil
 import subprocess
+import importlib
 
 
 def get_duration(input_video):
@@ -51,6 +55,18 @@ def test_srts():
     assert parsed[6]["end"] == approx(22.96)
 
 
+def test_srt_iter_parse():
+    with open(File("test_inputs/manifesto.srt")) as infile:
+        cues = videogrep.srt.iter_parse(infile)
+        first = next(cues)
+        assert first["content"] == "this audiobook is in the public domain"
+        rest = list(cues)
+
+    with open(File("test_inputs/manifesto.srt")) as infile:
+        assert [first] + rest == videogrep.srt.parse(infile.read())
+    assert rest[-1]["content"] == rest[-1]["content"].strip()
+
+
 def test_cued_vtts():
     testfile = File("test_inputs/manifesto.vtt")
     with open(testfile) as infile:
@@ -71,6 +87,21 @@ def test_cued_vtts():
     assert word["end"] == approx(84.87)
 
 
+def test_streaming_vtt():
+    for subfile in ["manifesto.vtt", "emptyvideo.aa.vtt"]:
+        with open(File("test_inputs/" + subfile)) as infile:
+            expected = videogrep.vtt.parse_full(infile)
+        with open(File("test_inputs/" + subfile)) as infile:
+            assert videogrep.vtt.parse_stream(infile) == expected
+
+    cue = (
+        "00:00:01.000 --> 00:00:03.000\n<v Bob>fish<00:00:02.000><c> &amp; chips</c>\n"
+    )
+    parsed = videogrep.vtt.parse(cue)
+    assert parsed[0]["content"] == "fish & chips"
+    assert parsed[0]["words"][0]["end"] == approx(2.0)
+
+
 def test_find_sub():
     testvid = File("test_inputs/manifesto.mp4")
     testsubfile = File("test_inputs/manifesto.json")
@@ -117,6 +148,51 @@ def test_parse_transcript():
     assert transcript[0]["content"] == "this audiobook is in the public domain"
 
 
+def test_transcript_cache(tmp_path):
+    subfile = tmp_path / "manifesto.srt"
+    subfile.write_text(Path(File("test_inputs/manifesto.srt")).read_text())
+    cache_dir = str(tmp_path / "cache")
+
+    transcript = videogrep.load_transcript(str(subfile), cache_dir)
+    assert transcript[0]["content"] == "this audiobook is in the public domain"
+    assert len(list((tmp_path / "cache" / "transcripts").iterdir())) == 1
+
+    # reused from memory
+    assert videogrep.load_transcript(str(subfile), cache_dir) is transcript
+
+    # parse_transcript returns a copy that is safe to modify
+    parsed = videogrep.parse_transcript(str(tmp_path / "manifesto.mp4"))
+    parsed[0]["content"] = "changed"
+    assert (
+        videogrep.parse_transcript(str(tmp_path / "manifesto.mp4"))
+        == transcript.to_dicts()
+    )
+
+    # changing the file invalidates the cache
+    subfile.write_text("1\n00:00:00,000 --> 00:00:01,000\nchanged\n")
+    transcript = videogrep.load_transcript(str(subfile), cache_dir)
+    assert transcript[0]["content"].strip() == "changed"
+
+
+def test_compact_transcript():
+    for subfile in ["manifesto.json", "manifesto.vtt", "manifesto.srt"]:
+        with open(File("test_inputs/" + subfile), encoding="utf8") as infile:
+            if subfile.endswith(".json"):
+                data = json.load(infile)
+            elif subfile.endswith(".vtt"):
+                data = videogrep.vtt.parse(infile)
+            else:
+                data = videogrep.srt.parse(infile)
+
+        transcript = videogrep.Transcript.from_dicts(data)
+        assert len(transcript) == len(data)
+        assert transcript.to_dicts() == data
+        assert transcript[-1] == data[-1]
+
+    assert transcript.word_level is False
+    assert len(videogrep.Transcript.from_dicts([])) == 0
+
+
 def test_export_xml():
     pass
 
@@ -310,6 +386,480 @@ def test_videogrep():
     assert get_duration(out4) == approx(6.269388)
 
 
+def test_copy_renderer(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+
+    assert videogrep.render.plan_cuts(12.5, 14, [0, 10, 20]) == [(12.5, 14, True)]
+    assert videogrep.render.plan_cuts(8, 14, [0, 10, 20]) == [
+        (8, 10, True),
+        (10, 14, False),
+    ]
+    assert videogrep.render.plan_cuts(10, 14, [0, 10, 20]) == [(10, 14, False)]
+
+    assert videogrep.render.snap_cuts(12.5, 14, [0, 10, 20]) == [(10, 20, False)]
+    assert videogrep.render.snap_cuts(10, 20, [0, 10, 20]) == [(10, 20, False)]
+    assert videogrep.render.snap_cuts(22, 23, [0, 10, 20], 25) == [(20, 25, False)]
+
+    assert videogrep.probe.probe(testvid)["video"]["b_frames"]
+    assert videogrep.render.copy_format([testvid], "supercut.mp4") is not None
+    audio = File("test_inputs/manifesto_audio.mp3")
+    assert videogrep.render.copy_format([audio], "supercut.mp4") is None
+
+    # frames stored out of order can't be spliced onto a re-encoded start,
+    # so clips from videos with B-frames are widened to whole keyframe intervals
+    out = str(tmp_path / "bframes.mp4")
+    segments = videogrep.search(testvid, "communist|communism", search_type="fragment")
+    segments = videogrep.pad_and_sync(segments, padding=0.3)
+    assert videogrep.render.create_supercut_copy(segments, out)
+    assert videogrep.probe.probe(out)["duration"] == approx(90, abs=0.1)
+    ffmpeg = videogrep.probe.ffmpeg_binary()
+    result = subprocess.run(
+        [ffmpeg, "-v", "error", "-i", out, "-f", "null", "-"], stderr=subprocess.PIPE
+    )
+    assert result.stderr == b""
+
+    # the same video, encoded without B-frames
+    source = str(tmp_path / "manifesto.mp4")
+    shutil.copy(File("test_inputs/manifesto.json"), tmp_path / "manifesto.json")
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-i", testvid, "-c:v", "libx264", "-bf", "0"]
+        + ["-g", "50", "-c:a", "aac", source],
+        check=True,
+    )
+    assert videogrep.render.copy_format([source], "supercut.mp4") is not None
+    assert videogrep.render.copy_format([source], "supercut.webm") is None
+
+    for padding in [0.3, 3]:
+        out = str(tmp_path / "supercut.mp4")
+        segments = videogrep.search(
+            source, "communist|communism", search_type="fragment"
+        )
+        segments = videogrep.pad_and_sync(segments, padding=padding)
+        assert videogrep.render.create_supercut_copy(segments, out)
+
+        info = videogrep.probe.probe(out)
+        duration = sum([s["end"] - s["start"] for s in segments])
+        assert info["duration"] == approx(duration, abs=0.1)
+        assert info["audio"] is not None
+
+        # the spliced pieces decode without timestamp errors
+        result = subprocess.run(
+            [ffmpeg, "-v", "error", "-i", out, "-f", "null", "-"],
+            stderr=subprocess.PIPE,
+        )
+        assert result.stderr == b""
+
+
+def test_export_clips_parallel(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+
+    # the test video has B-frames, so copied clips span whole keyframe intervals
+    for renderer, duration in [("moviepy", 0.36), ("copy", 10)]:
+        out = str(tmp_path / f"{renderer}.mp4")
+        videogrep.videogrep(
+            testvid,
+            "communist",
+            search_type="fragment",
+            output=out,
+            export_clips=True,
+            jobs=2,
+            renderer=renderer,
+        )
+        clips = sorted(glob.glob(str(tmp_path / f"{renderer}_*.mp4")))
+        assert len(clips) == 4
+        assert videogrep.probe.probe(clips[0])["duration"] == approx(duration, abs=0.1)
+
+    assert glob.glob(str(tmp_path / "*temp-audio*")) == []
+
+
+def test_stream_renderer(tmp_path):
+    clips = [("a.mp4", 0, 0.5), ("a.mp4", 1, 1.3), ("a.mp4", 2, 2.3)]
+    assert videogrep.render.stream_lengths(clips, 25) == [12, 8, 7]
+    assert sum(videogrep.render.stream_lengths(clips, 44100)) == 48510
+
+    out = str(tmp_path / "supercut.mp4")
+    videogrep.videogrep(
+        File("test_inputs/manifesto.mp4"),
+        "communist|communism",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        renderer="stream",
+    )
+    info = videogrep.probe.probe(out)
+    assert info["duration"] == approx(9.4, abs=0.05)
+    assert info["audio"] is not None
+
+    out = str(tmp_path / "supercut.mp3")
+    videogrep.videogrep(
+        File("test_inputs/manifesto_audio.mp3"),
+        "communist|communism",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        renderer="stream",
+    )
+    assert videogrep.probe.probe(out)["duration"] == approx(9.4, abs=0.1)
+
+
+def test_clip_cache(tmp_path, capsys):
+    testvid = File("test_inputs/manifesto.mp4")
+    cache_dir = str(tmp_path / "cache")
+
+    # a transcript cache alone doesn't change how the supercut is rendered
+    out = str(tmp_path / "supercut.mp4")
+    videogrep.videogrep(
+        testvid,
+        "communist|communism",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        cache_dir=cache_dir,
+    )
+    assert "Reused" not in capsys.readouterr().out
+    assert not os.path.exists(os.path.join(cache_dir, "clips"))
+
+    videogrep.videogrep(
+        testvid,
+        "communist|communism",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        cache_dir=cache_dir,
+        clip_cache_size=100,
+    )
+    assert "Reused 0 of 8 clips" in capsys.readouterr().out
+    assert videogrep.probe.probe(out)["duration"] == approx(9.5, abs=0.1)
+
+    # a different query reuses the clips it shares with the first one
+    videogrep.videogrep(
+        testvid,
+        "communist",
+        search_type="fragment",
+        output=str(tmp_path / "clip.mp4"),
+        padding=0.3,
+        cache_dir=cache_dir,
+        clip_cache_size=100,
+        export_clips=True,
+    )
+    assert "Reused 4 of 4 clips" in capsys.readouterr().out
+    assert len(glob.glob(str(tmp_path / "clip_*.mp4"))) == 4
+
+    videogrep.clipcache.evict(cache_dir, 0)
+    assert os.listdir(os.path.join(cache_dir, "clips")) == []
+
+
+def test_clip_cache_mixed_sizes(tmp_path, capsys):
+    testvid = File("test_inputs/manifesto.mp4")
+    cache_dir = str(tmp_path / "cache")
+
+    # the same video at half the size
+    small = str(tmp_path / "small.mp4")
+    ffmpeg = videogrep.probe.ffmpeg_binary()
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-i", testvid, "-vf", "scale=160:90", small],
+        check=True,
+    )
+    shutil.copyfile(File("test_inputs/manifesto.json"), str(tmp_path / "small.json"))
+
+    out = str(tmp_path / "small_supercut.mp4")
+    videogrep.videogrep(
+        small,
+        "communist",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        cache_dir=cache_dir,
+        clip_cache_size=100,
+    )
+    assert "Reused 0 of 4 clips" in capsys.readouterr().out
+    info = videogrep.probe.probe(out)["video"]
+    assert (info["width"], info["height"]) == (160, 90)
+
+    # clips are cached at their source's size, so mixing in a larger
+    # source reuses them and pads them when joining
+    out = str(tmp_path / "supercut.mp4")
+    videogrep.videogrep(
+        [small, testvid],
+        "communist",
+        search_type="fragment",
+        output=out,
+        padding=0.3,
+        cache_dir=cache_dir,
+        clip_cache_size=100,
+    )
+    assert "Reused 4 of 8 clips" in capsys.readouterr().out
+    info = videogrep.probe.probe(out)
+    assert (info["video"]["width"], info["video"]["height"]) == (320, 180)
+    assert info["duration"] == approx(8.95, abs=0.1)
+
+
+def test_pcm_supercut(tmp_path):
+    testaudio = File("test_inputs/manifesto_audio.mp3")
+    cache_dir = str(tmp_path / "cache")
+    segments = videogrep.search(
+        testaudio, "communist|communism", search_type="fragment"
+    )
+
+    duration = sum([s["end"] - s["start"] for s in segments])
+
+    # without a cache only the clips are decoded, and nothing is left behind
+    out = str(tmp_path / "nocache.mp3")
+    videogrep.create_supercut(segments, out)
+    assert videogrep.probe.probe(out)["duration"] == approx(duration, abs=0.1)
+    assert sorted(os.listdir(tmp_path)) == ["nocache.mp3"]
+
+    # a transcript cache alone doesn't keep decoded audio
+    out = str(tmp_path / "transcripts.mp3")
+    videogrep.videogrep(
+        testaudio,
+        "communist|communism",
+        search_type="fragment",
+        output=out,
+        cache_dir=cache_dir,
+    )
+    assert videogrep.probe.probe(out)["duration"] == approx(duration, abs=0.1)
+    assert not os.path.exists(os.path.join(cache_dir, "pcm"))
+
+    out = str(tmp_path / "supercut.mp3")
+    videogrep.create_supercut(segments, out, cache_dir)
+    assert videogrep.probe.probe(out)["duration"] == approx(duration, abs=0.1)
+
+    decoded = glob.glob(os.path.join(cache_dir, "pcm", "*.pcm"))
+    assert len(decoded) == 1
+    samples = videogrep.pcm.load(decoded[0])
+    assert samples.shape[1] == 2
+    assert len(samples) / 44100 == approx(
+        videogrep.probe.probe(testaudio)["duration"], abs=0.1
+    )
+
+
+def test_render_batches(tmp_path, capsys):
+    testvid = File("test_inputs/manifesto.mp4")
+    segments = videogrep.search(testvid, "communist", search_type="fragment")
+
+    batches = [
+        (segments[0:2], str(tmp_path / "batch0.mp4")),
+        ([{"file": "missing.mp4", "start": 0, "end": 1}], str(tmp_path / "batch1.mp4")),
+        (segments[2:4], str(tmp_path / "batch2.mp4")),
+    ]
+    rendered = videogrep.render_batches(batches, jobs=2)
+
+    assert rendered == [batches[0][1], batches[2][1]]
+    assert all(Path(f).exists() for f in rendered)
+    assert "Batch 2 of 3 failed" in capsys.readouterr().out
+
+    joined = str(tmp_path / "joined.mp4")
+    assert videogrep.render.join_files(rendered, joined)
+    durations = [videogrep.probe.probe(f)["duration"] for f in rendered]
+    assert videogrep.probe.probe(joined)["duration"] == approx(sum(durations), abs=0.1)
+
+
+def test_join_batches(tmp_path, monkeypatch, capsys):
+    module = importlib.import_module("videogrep.videogrep")
+    monkeypatch.setattr(module, "BATCH_SIZE", 2)
+
+    def no_fallback(*args, **kwargs):
+        raise AssertionError("batches were re-encoded")
+
+    monkeypatch.setattr(module, "VideoFileClip", no_fallback)
+
+    testvid = File("test_inputs/manifesto.mp4")
+    segments = videogrep.search(testvid, "communist|communism", search_type="fragment")
+    out = str(tmp_path / "supercut.mp4")
+    videogrep.create_supercut_in_batches(segments, out)
+
+    # moviepy's batches have B-frames, which doesn't stop them being joined whole
+    output = capsys.readouterr().out
+    assert "Joining batches" in output
+    assert "can't be joined" not in output
+    duration = sum([s["end"] - s["start"] for s in segments])
+    assert videogrep.probe.probe(out)["duration"] == approx(duration, abs=0.2)
+    assert glob.glob(out + ".*") == []
+
+
+def test_plan_batches():
+    testvid = File("test_inputs/manifesto.mp4")
+    clips = [{"file": testvid, "start": i, "end": i + 1} for i in range(250)]
+
+    batches = videogrep.plan_batches(clips)
+    assert [len(b) for b in batches] == [100, 100, 50]
+
+    batches = videogrep.plan_batches(clips, duration=30)
+    assert [len(b) for b in batches] == [30] * 8 + [10]
+
+    # unknown files are estimated as 1080p, and each one needs its own reader
+    clips = [{"file": f"missing{i}.mp4", "start": 0, "end": 1} for i in range(10)]
+    batches = videogrep.plan_batches(clips, memory=200)
+    assert [len(b) for b in batches] == [2] * 5
+
+
+def test_render_batches_split(tmp_path, monkeypatch, capsys):
+    def render_batch(composition, filename):
+        if len(composition) > 1:
+            raise MemoryError()
+        Path(filename).touch()
+
+    module = importlib.import_module("videogrep.videogrep")
+    monkeypatch.setattr(module, "render_batch", render_batch)
+
+    clips = [{"file": "a.mp4", "start": i, "end": i + 1} for i in range(3)]
+    batches = [
+        (clips, str(tmp_path / "batch0.mp4")),
+        (clips[:1], str(tmp_path / "batch1.mp4")),
+    ]
+    rendered = videogrep.render_batches(batches)
+
+    assert [Path(f).name for f in rendered] == [
+        "batch0-0.mp4",
+        "batch0-1-0.mp4",
+        "batch0-1-1.mp4",
+        "batch1.mp4",
+    ]
+    assert "left out" not in capsys.readouterr().out
+
+
+def test_reader_pool(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+    files = []
+    for i in range(3):
+        files.append(str(tmp_path / f"video{i}.mp4"))
+        Path(files[-1]).symlink_to(testvid)
+
+    composition = [{"file": files[i % 3], "start": i, "end": i + 0.5} for i in range(6)]
+    assert videogrep.readers.group_by_source(composition) == [0, 3, 1, 4, 2, 5]
+
+    with videogrep.readers.ReaderPool(size=2) as pool:
+        # cutting reads the files' format from probe(), without opening them
+        clips = pool.cut(composition)
+        assert pool.opened == 0
+        assert [c.duration for c in clips] == [0.5] * 6
+
+        # a clip opens its file when it is rendered
+        for clip in clips[:3]:
+            frame = clip.get_frame(0.1)
+            assert frame.shape == (180, 320, 3)
+        assert pool.opened == 3
+        assert len(pool.clips) == 2
+
+        # the first file was closed to make room for the third
+        clips[3].get_frame(0.1)
+        assert pool.opened == 4
+    assert len(pool.clips) == 0
+
+
+def test_probe_cache(tmp_path):
+    testvid = str(tmp_path / "video.mp4")
+    Path(testvid).symlink_to(File("test_inputs/manifesto.mp4"))
+    cache_dir = str(tmp_path / "cache")
+
+    videogrep.probe.set_cache_dir(cache_dir)
+    try:
+        info = videogrep.probe.probe(testvid)
+        keys = videogrep.probe.keyframes(testvid)
+    finally:
+        videogrep.probe.set_cache_dir(None)
+
+    assert (info["video"]["width"], info["video"]["height"]) == (320, 180)
+    assert len(os.listdir(os.path.join(cache_dir, "probes"))) == 1
+    assert len(os.listdir(os.path.join(cache_dir, "keyframes"))) == 1
+
+    # later runs read the results from the folder
+    stamp = videogrep.cache.file_stamp(testvid)
+    path = os.path.abspath(testvid)
+    assert videogrep.cache.load(cache_dir, "probes", path, stamp) == info
+    assert videogrep.cache.load(cache_dir, "keyframes", path, stamp) == keys
+
+    # frames without a timestamp are skipped
+    assert videogrep.probe._pts_times("1.5\nN/A\n0.000000,\n") == [0.0, 1.5]
+
+    # videogrep() only uses its cache folder while it runs
+    videogrep.videogrep(
+        testvid, "communist", output=str(tmp_path / "out.m3u"), cache_dir=cache_dir
+    )
+    assert videogrep.probe.CACHE_DIR is None
+
+    # inputs are probed, so an .mp4 with only audio counts as audio
+    audio = str(tmp_path / "audio.mp4")
+    ffmpeg = videogrep.probe.ffmpeg_binary()
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-i", testvid, "-vn", "-c:a", "copy", audio],
+        check=True,
+    )
+    assert videogrep.get_input_type([{"file": testvid}]) == "video"
+    assert videogrep.get_input_type([{"file": audio}]) == "audio"
+
+    # outputs go by their extension, even if an earlier run left audio there
+    video_composition = [{"file": testvid, "start": 0, "end": 1}]
+    assert videogrep.get_file_type(audio) == "video"
+    assert videogrep.plan_video_output(video_composition, audio)
+
+
+def test_resume_batches(tmp_path, monkeypatch, capsys):
+    module = importlib.import_module("videogrep.videogrep")
+    monkeypatch.setattr(module, "BATCH_SIZE", 2)
+    render_batch = module.render_batch
+    rendered = []
+
+    def interrupted(composition, filename):
+        if len(rendered) == 1:
+            raise KeyboardInterrupt()
+        render_batch(composition, filename)
+        rendered.append(filename)
+
+    def counted(composition, filename):
+        render_batch(composition, filename)
+        rendered.append(filename)
+
+    testvid = File("test_inputs/manifesto.mp4")
+    segments = videogrep.search(testvid, "communist", search_type="fragment")
+    out = str(tmp_path / "supercut.mp4")
+
+    monkeypatch.setattr(module, "render_batch", interrupted)
+    try:
+        videogrep.create_supercut_in_batches(segments, out)
+    except KeyboardInterrupt:
+        pass
+    assert list(module.load_manifest(out + ".manifest.json")) == [out + ".tmp0.mp4"]
+
+    rendered = []
+    monkeypatch.setattr(module, "render_batch", counted)
+    videogrep.create_supercut_in_batches(segments, out, resume=True)
+    assert rendered == [out + ".tmp2.mp4"]
+    assert "Resuming with 1 of 2 batches done" in capsys.readouterr().out
+    assert os.path.exists(out)
+    assert not os.path.exists(out + ".manifest.json")
+
+    # halves of a batch that ran out of memory are resumed too
+    def split(composition, filename):
+        if filename.endswith(".tmp2.mp4"):
+            raise MemoryError()
+        if filename.endswith(".tmp2-1.mp4"):
+            raise KeyboardInterrupt()
+        render_batch(composition, filename)
+
+    for changed in [False, True]:
+        monkeypatch.setattr(module, "render_batch", split)
+        try:
+            videogrep.create_supercut_in_batches(segments, out)
+        except KeyboardInterrupt:
+            pass
+        finished = list(module.load_manifest(out + ".manifest.json"))
+        assert finished == [out + ".tmp0.mp4", out + ".tmp2-0.mp4"]
+
+        rendered = []
+        monkeypatch.setattr(module, "render_batch", counted)
+        if changed:
+            # the split half no longer matches, so its file is removed
+            videogrep.create_supercut_in_batches(segments[:3], out, resume=True)
+            assert rendered == [out + ".tmp2.mp4"]
+        else:
+            videogrep.create_supercut_in_batches(segments, out, resume=True)
+            assert rendered == [out + ".tmp2-1.mp4"]
+            assert "Resuming with 2 of 3 batches done" in capsys.readouterr().out
+        assert glob.glob(out + ".*") == []
+
+
 def test_videogrep_vtt_out():
     out1 = File("test_outputs/supercut1.mp4")
     out1_vtt = Path(out1).with_suffix(".vtt")
@@ -387,6 +937,92 @@ def test_sentence_search_json():
     assert segments[-1]["end"] == approx(76.35)
 
 
+def test_sentence_search_many_queries():
+    testvid = File("test_inputs/manifesto.mp4")
+
+    for queries in [["communist", "spectre", "the"], ["communis(t|m)", "spectre$"]]:
+        segments = videogrep.search(testvid, queries)
+        expected = []
+        for query in queries:
+            expected += videogrep.search(testvid, query)
+        assert len(segments) == len(expected)
+        for s in segments:
+            assert re.search(s["query"], s["content"])
+
+    matcher = videogrep.matcher.QueryMatcher(["he", "she", "his", "hers"])
+    assert matcher.matches("ushers") == [0, 1, 3]
+
+    # an inline flag in one query must not apply to the others
+    matcher = videogrep.matcher.QueryMatcher(["(?i)foo", "Bar"])
+    assert matcher.matches("bar") == []
+    assert matcher.matches("FOO Bar") == [0, 1]
+
+
+def test_literal_prefilter(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+
+    literals = videogrep.matcher.required_literals
+    assert literals(re.compile(r"\bclimate (change|crisis)\b")) == ["climate ", "c"]
+    assert literals(re.compile(r"(?i)Hello\s+World")) == ["hello", "world"]
+    assert literals(re.compile(r"a|b")) == []
+
+    plan = videogrep.matcher.QueryPlan(r"(?i)istanbul")
+    assert plan.search("\u0130STANBUL")
+
+    query = r"\bcommunis(t|m)\b"
+    stats = {}
+    segments = videogrep.search(testvid, query, stats=stats)
+    assert len(segments) > 0
+    assert 0 < stats["pruned"] < stats["candidates"]
+
+    stats = {}
+    indexed = videogrep.search(
+        testvid, query, index=str(tmp_path / "index.db"), stats=stats
+    )
+    assert indexed == segments
+    assert stats["pruned"] > 0
+
+
+def test_buffer_engine():
+    testvid = File("test_inputs/manifesto.mp4")
+
+    queries = ["communist", "^The", "ing$", r"\bclass(es)?\b", "power(?= of)"]
+    for query in queries:
+        expected = videogrep.search(testvid, query)
+        assert videogrep.search(testvid, query, engine="buffer") == expected
+    assert videogrep.search(testvid, queries, engine="buffer") == videogrep.search(
+        testvid, queries
+    )
+
+    transcript = videogrep.Transcript.from_dicts(
+        [
+            {"content": "the end of", "start": 0, "end": 1},
+            {"content": "the world", "start": 1, "end": 2},
+        ]
+    )
+    assert videogrep.scan_transcript(transcript, [r"of\s+the"]) == []
+    assert videogrep.scan_transcript(transcript, [r"of\s+the"], True) == [(0, 0, 1)]
+
+
+def test_vgt(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+
+    for subfile in ["manifesto.srt", "manifesto.vtt", "manifesto.json"]:
+        outfile = str(tmp_path / "manifesto.vgt")
+        assert videogrep.convert_to_vgt(File("test_inputs/" + subfile), outfile)
+        expected = videogrep.parse_subfile(File("test_inputs/" + subfile))
+        assert videogrep.vgt.load(outfile).to_dicts() == expected
+
+    # the video doesn't need to exist to search its transcript
+    copy = str(tmp_path / "manifesto.mp4")
+    assert videogrep.find_transcript(copy) == outfile
+    for search_type in ["sentence", "fragment"]:
+        segments = videogrep.search(copy, "communist", search_type)
+        expected = videogrep.search(testvid, "communist", search_type, prefer=".json")
+        assert len(segments) > 0
+        assert [s["content"] for s in segments] == [s["content"] for s in expected]
+
+
 def test_word_search_srt():
     testvid = File("test_inputs/manifesto.mp4")
 
@@ -496,6 +1132,117 @@ def test_sentence_search_vtt():
     assert len(segments) == 0
 
 
+def test_search_index(tmp_path):
+    testvid = File("test_inputs/manifesto.mp4")
+    index = str(tmp_path / "videogrep.index")
+
+    for prefer in [".json", ".vtt", ".srt"]:
+        for query in ["communist", "communist party", "spectre .*", "ing$"]:
+            for search_type in ["sentence", "fragment"]:
+                expected = videogrep.search(
+                    testvid, query, search_type=search_type, prefer=prefer
+                )
+                segments = videogrep.search(
+                    testvid, query, search_type=search_type, prefer=prefer, index=index
+                )
+                assert segments == expected
+
+    segments = videogrep.search(testvid, "Spectre", search_type="mash", index=index)
+    assert len(segments) == 1
+    assert segments[0]["content"] == "spectre"
+
+    # blank fragment queries match nothing, as without an index
+    assert videogrep.search(testvid, " ", search_type="fragment", index=index) == []
+
+    # unchanged transcripts are not re-indexed, whatever the working directory
+    with videogrep.index.Index(index) as idx:
+        assert idx.lookup(File("test_inputs/manifesto.json")) is not None
+        cwd = os.getcwd()
+        os.chdir(tmp_path)
+        try:
+            relative = os.path.relpath(File("test_inputs/manifesto.json"))
+            assert idx.lookup(relative) is not None
+        finally:
+            os.chdir(cwd)
+
+
+def test_search_index_files(tmp_path):
+    files = [
+        File("test_inputs/manifesto.mp4"),
+        File("test_inputs/whatever.mp4"),
+        File("test_inputs/manifesto_audio.mp3"),
+    ]
+    index = str(tmp_path / "videogrep.index")
+
+    for query in ["communist", "communist party", "spectre .*", "the"]:
+        for search_type in ["sentence", "fragment"]:
+            expected = videogrep.search(files, query, search_type=search_type)
+            segments = videogrep.search(
+                files, query, search_type=search_type, index=index
+            )
+            assert segments == expected
+
+
+def test_search_jobs():
+    files = [
+        File("test_inputs/manifesto.mp4"),
+        File("test_inputs/whatever.mp4"),
+        File("test_inputs/manifesto_audio.mp3"),
+    ]
+    for search_type in ["sentence", "fragment"]:
+        expected = videogrep.search(files, "communist", search_type=search_type)
+        segments = videogrep.search(files, "communist", search_type=search_type, jobs=2)
+        assert segments == expected
+        assert segments[0]["file"] == files[0]
+        assert segments[-1]["file"] == files[-1]
+
+
+def test_iter_search():
+    testvid = File("test_inputs/manifesto.mp4")
+    expected = videogrep.search(testvid, "communist", search_type="fragment")
+
+    results = videogrep.iter_search(
+        [testvid, File("test_inputs/whatever.mp4")], "communist", search_type="fragment"
+    )
+    assert next(results) == expected[0]
+    assert list(results) == expected[1:]
+
+
+def test_search_stops_early(monkeypatch, capsys):
+    module = importlib.import_module("videogrep.videogrep")
+    iter_search = module.iter_search
+
+    def tracked(*args, **kwargs):
+        try:
+            yield from iter_search(*args, **kwargs)
+        finally:
+            print("closed")
+
+    monkeypatch.setattr(module, "iter_search", tracked)
+    files = [File("test_inputs/manifesto.mp4"), File("test_inputs/manifesto_audio.mp3")]
+    videogrep.videogrep(files, "communist", maxclips=1, demo=True, jobs=2, stats=True)
+
+    # the search is closed once there are enough clips, before anything else runs
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert len(lines) == 3
+    assert lines[1] == "closed"
+    assert lines[2].startswith("Checked")
+
+
+def test_mash(tmp_path):
+    files = [File("test_inputs/manifesto.mp4"), File("test_inputs/manifesto_audio.mp3")]
+    index = str(tmp_path / "videogrep.index")
+
+    for idx in [None, index]:
+        # missing words are skipped instead of failing the whole mash
+        segments = videogrep.search(
+            files, "Spectre alskdfj communist", search_type="mash", index=idx
+        )
+        assert len(segments) == 2
+        assert sorted(s["content"] for s in segments) == ["communist", "spectre"]
+        assert all(s["file"] in files for s in segments)
+
+
 def test_file_type():
     videofile_1 = File("test_inputs/somevid.mp4")
     assert videogrep.get_file_type(videofile_1) == "video"
@@ -1,11 +1,29 @@
 __version__ = "2.3.0"
 
-from . import vtt, srt, sphinx, fcpxml
+from . import (
+    vtt,
+    srt,
+    sphinx,
+    fcpxml,
+    index,
+    cache,
+    matcher,
+    vgt,
+    probe,
+    render,
+    readers,
+    clipcache,
+)
+from .transcript import Transcript
 from .videogrep import (
     videogrep,
     cleanup_log_files,
     create_supercut,
     create_supercut_in_batches,
+    create_supercut_stream,
+    create_supercut_cached,
+    plan_batches,
+    render_batches,
     export_individual_clips,
     export_m3u,
     export_mpv_edl,
@@ -15,12 +33,23 @@ from .videogrep import (
     get_input_type,
     get_ngrams,
     parse_transcript,
+    parse_subfile,
+    convert_to_vgt,
+    load_transcript,
     plan_no_action,
     plan_video_output,
     plan_audio_output,
     remove_overlaps,
     pad_and_sync,
     search,
+    iter_search,
+    search_index,
+    search_index_files,
+    search_file,
+    scan_transcript,
+    mash,
     BATCH_SIZE,
+    BATCH_MEMORY,
+    CLIP_CACHE_SIZE,
     SUB_EXTS,
 )
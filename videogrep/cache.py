@@ -0,0 +1,79 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from typing import Any, Optional, Tuple
+
+CACHE_VERSION = 4
+
+
+def file_stamp(filename: str) -> Tuple[int, int]:
+    """
+    Returns a stamp that changes whenever a file is modified
+
+    :param filename str: File path
+    :rtype Tuple[int, int]: File mtime (in nanoseconds) and size
+    """
+    stat = os.stat(filename)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def cache_path(cache_dir: str, category: str, key: str, ext: str = ".pickle") -> str:
+    """
+    Returns the location of a cache entry
+
+    :param cache_dir str: Cache folder
+    :param category str: Cache sub-folder (ie "transcripts")
+    :param key str: Unique key for the entry, usually a file path
+    :param ext str: File extension for the entry
+    :rtype str: Cache file path
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, category, digest + ext)
+
+
+def load(cache_dir: str, category: str, key: str, stamp: Any) -> Optional[Any]:
+    """
+    Loads an entry from the on-disk cache
+
+    :param cache_dir str: Cache folder
+    :param category str: Cache sub-folder
+    :param key str: Unique key for the entry
+    :param stamp Any: Value the entry was saved with. Entries with a different stamp are stale
+    :rtype Optional[Any]: The cached data, or None if missing or stale
+    """
+    filename = cache_path(cache_dir, category, key)
+    try:
+        with open(filename, "rb") as infile:
+            entry = pickle.load(infile)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    if entry.get("version") != CACHE_VERSION or entry.get("stamp") != stamp:
+        return None
+
+    return entry["data"]
+
+
+def save(cache_dir: str, category: str, key: str, stamp: Any, data: Any):
+    """
+    Saves an entry to the on-disk cache
+
+    :param cache_dir str: Cache folder
+    :param category str: Cache sub-folder
+    :param key str: Unique key for the entry
+    :param stamp Any: Value used to check if the entry is stale when loading
+    :param data Any: Data to save
+    """
+    filename = cache_path(cache_dir, category, key)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    # write to a temporary file first so parallel runs never see partial entries
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    with os.fdopen(fd, "wb") as outfile:
+        pickle.dump(
+            {"version": CACHE_VERSION, "stamp": stamp, "data": data},
+            outfile,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmpname, filename)
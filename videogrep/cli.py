@@ -1,5 +1,13 @@
 import argparse
-from . import get_ngrams, sphinx, videogrep, __version__
+from . import (
+    get_ngrams,
+    sphinx,
+    videogrep,
+    find_transcript,
+    convert_to_vgt,
+    BATCH_MEMORY,
+    __version__,
+)
 
 
 def main():
@@ -103,6 +111,13 @@ def main():
         dest="model",
         help="model folder for transcription",
     )
+    parser.add_argument(
+        "--convert-vgt",
+        "-cv",
+        dest="convert_vgt",
+        action="store_true",
+        help="convert transcripts to the compact .vgt format",
+    )
     parser.add_argument(
         "--ngrams",
         "-n",
@@ -124,18 +139,100 @@ def main():
         help="preview in mpv (requires mpv to be installed!)",
         action="store_true",
     )
+    parser.add_argument(
+        "--index",
+        "-ix",
+        dest="index",
+        help="path to a word index to speed up repeated searches (created if missing)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        "-cd",
+        dest="cache_dir",
+        help="folder to cache parsed transcripts and rendered clips in",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="number of processes to use",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        action="store_true",
+        help="print how many sentences the search skipped without running the full regex",
+    )
+    parser.add_argument(
+        "--engine",
+        "-e",
+        dest="engine",
+        default="line",
+        choices=["line", "buffer"],
+        help="sentence search engine: search each line, or scan whole transcripts at once",
+    )
+    parser.add_argument(
+        "--cross-sentences",
+        "-cs",
+        dest="cross_sentences",
+        action="store_true",
+        help="with the buffer engine, also match phrases that run across sentences",
+    )
+    parser.add_argument(
+        "--renderer",
+        "-re",
+        dest="renderer",
+        default="moviepy",
+        choices=["moviepy", "copy", "stream"],
+        help="re-encode clips with moviepy, cut and join them with ffmpeg without re-encoding, or pipe them to a single ffmpeg encoder",
+    )
+    parser.add_argument(
+        "--batch-memory",
+        "-bm",
+        dest="batch_memory",
+        type=int,
+        default=BATCH_MEMORY,
+        help="megabytes of memory to render long supercuts with, shared between jobs",
+    )
+    parser.add_argument(
+        "--clip-cache-size",
+        "-ccs",
+        dest="clip_cache_size",
+        type=int,
+        default=None,
+        help="cache rendered clips in the cache folder, keeping up to this many megabytes",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="reuse the finished batches of an earlier render of the same supercut that was interrupted",
+    )
     args = parser.parse_args()
 
     if args.ngrams > 0:
         from collections import Counter
 
-        grams = get_ngrams(args.inputfile, args.ngrams)
+        grams = get_ngrams(args.inputfile, args.ngrams, cache_dir=args.cache_dir)
         most_common = Counter(grams).most_common(100)
         for ngram, count in most_common:
             print(" ".join(ngram), count)
 
         return True
 
+    if args.convert_vgt:
+        for f in args.inputfile:
+            subfile = find_transcript(f)
+            if subfile is None:
+                print("No subtitle file found for ", f)
+            elif subfile.endswith(".vgt"):
+                print(subfile, "is already a .vgt file")
+            else:
+                print("Wrote", convert_to_vgt(subfile))
+        return True
+
     if args.sphinxtranscribe:
         for f in args.inputfile:
             sphinx.transcribe(f)
@@ -169,4 +266,14 @@ def main():
         export_clips=args.export_clips,
         write_vtt=args.write_vtt,
         preview=args.preview,
+        index=args.index,
+        cache_dir=args.cache_dir,
+        jobs=args.jobs,
+        stats=args.stats,
+        engine=args.engine,
+        cross_sentences=args.cross_sentences,
+        renderer=args.renderer,
+        batch_memory=args.batch_memory,
+        clip_cache_size=args.clip_cache_size,
+        resume=args.resume,
     )
@@ -0,0 +1,389 @@
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
+
+from . import cache
+from .probe import probe, ffmpeg_binary
+from .render import join_command, run_ffmpeg, SAMPLE_RATE, CHANNELS
+
+# megabytes of rendered clips to keep in the cache
+CLIP_CACHE_SIZE = 2048
+
+
+def clip_settings(composition: List[dict], outputfile: str, video: bool = True):
+    """
+    Picks the format a composition is joined in: the size and frame rate
+    of its largest source. Clips are cached in the format of their own
+    source (see source_format()), and only those that differ from this are
+    re-encoded before joining.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path the clips will be saved to
+    :param video bool: Encode video with audio, rather than only audio
+    :rtype Optional[dict]: The format, or None if an input can't be read
+    """
+    infos = [probe(f) for f in sorted(set([c["file"] for c in composition]))]
+    if any(info is None for info in infos):
+        return None
+
+    if not video:
+        return {"ext": os.path.splitext(outputfile)[1].lower()}
+
+    if any(info["video"] is None for info in infos):
+        return None
+
+    return {
+        "ext": ".mkv",
+        "width": max(info["video"]["width"] for info in infos),
+        "height": max(info["video"]["height"] for info in infos),
+        "fps": max(info["video"]["fps"] or 0 for info in infos) or 25,
+        "audio": any(info["audio"] is not None for info in infos),
+    }
+
+
+def source_format(info: dict, settings: dict) -> dict:
+    """
+    Picks the format clips of one source are cached in. Video keeps the
+    source's own size and frame rate, so that the clips can be reused by
+    supercuts that mix it with other sources.
+
+    :param info dict: The source's format, from probe()
+    :param settings dict: Format of the composition, from clip_settings()
+    :rtype dict: The format
+    """
+    if "fps" not in settings:
+        return settings
+
+    return {
+        **settings,
+        "width": info["video"]["width"],
+        "height": info["video"]["height"],
+        "fps": info["video"]["fps"] or 25,
+    }
+
+
+def render_clips(
+    composition: List[dict], cache_dir: str, settings: dict
+) -> Optional[List[Tuple[str, float, dict]]]:
+    """
+    Encodes each clip of a composition to its own file in the cache. Clips
+    that were encoded before, by any supercut, are reused. Entries are keyed
+    by the source file and its modification time, the start and end of the
+    clip, and the format of the source.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param cache_dir str: Cache folder
+    :param settings dict: Format from clip_settings()
+    :rtype Optional[List[Tuple[str, float, dict]]]: (path, duration, format) of each clip, or None if ffmpeg failed
+    """
+    clips = []
+    reused = 0
+
+    for c in composition:
+        info = probe(c["file"])
+        clip_format = source_format(info, settings)
+        start = max(c["start"], 0)
+        end = c["end"]
+        if info["duration"] is not None and end > info["duration"]:
+            end = info["duration"]
+
+        # cut on whole frames, so that each clip is exactly as long as intended
+        if "fps" in clip_format:
+            fps = clip_format["fps"]
+            start = round(start * fps) / fps
+            end = max(round(end * fps) / fps, start + 1 / fps)
+
+        filename = os.path.abspath(c["file"])
+        key = repr(
+            (
+                cache.CACHE_VERSION,
+                filename,
+                cache.file_stamp(filename),
+                round(start, 3),
+                round(end, 3),
+                sorted(clip_format.items()),
+            )
+        )
+        path = cache.cache_path(cache_dir, "clips", key, settings["ext"])
+
+        if os.path.exists(path):
+            # mark the clip as recently used
+            os.utime(path)
+            reused += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmpname = tempfile.mkstemp(
+                dir=os.path.dirname(path), prefix=".tmp", suffix=settings["ext"]
+            )
+            os.close(fd)
+            command = encode_clip_command(
+                filename, start, end, info, clip_format, tmpname
+            )
+            if not run_ffmpeg(command):
+                os.remove(tmpname)
+                return None
+            os.replace(tmpname, path)
+
+        clips.append((path, end - start, clip_format))
+
+    print(f"[+] Reused {reused} of {len(clips)} clips from the cache.")
+    return clips
+
+
+def encode_clip_command(
+    filename: str,
+    start: float,
+    end: float,
+    info: dict,
+    settings: dict,
+    outputfile: str,
+) -> List[str]:
+    """
+    Builds an ffmpeg command that encodes part of a file to a cache entry
+
+    :param filename str: Media file path
+    :param start float: Start in seconds
+    :param end float: End in seconds
+    :param info dict: The file's format, from probe()
+    :param settings dict: Format to encode to, from source_format()
+    :param outputfile str: Path to save the clip to
+    :rtype List[str]: ffmpeg arguments
+    """
+    command = [
+        ffmpeg_binary(),
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        str(start),
+        "-i",
+        filename,
+    ]
+
+    if "fps" not in settings:
+        return command + [
+            "-t",
+            str(end - start),
+            "-map",
+            "0:a:0",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-ac",
+            str(CHANNELS),
+            outputfile,
+        ]
+
+    # clips without audio get silence, so that every clip has the same streams
+    audio = "0:a:0"
+    if settings["audio"] and info["audio"] is None:
+        layout = "stereo" if CHANNELS == 2 else "mono"
+        command += ["-f", "lavfi", "-i", f"anullsrc=r={SAMPLE_RATE}:cl={layout}"]
+        audio = "1:a:0"
+
+    command += ["-t", str(end - start), "-map", "0:v:0"] + video_args(settings)
+    if settings["audio"]:
+        command += [
+            "-map",
+            audio,
+            "-c:a",
+            "aac",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-ac",
+            str(CHANNELS),
+        ]
+
+    return command + ["-f", "matroska", outputfile]
+
+
+def video_args(settings: dict) -> List[str]:
+    """
+    Builds the ffmpeg arguments that encode video to a format, padding
+    smaller frames with black
+
+    :param settings dict: Format to encode to
+    :rtype List[str]: ffmpeg arguments
+    """
+    width = settings["width"]
+    height = settings["height"]
+    return [
+        "-vf",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "-r",
+        str(settings["fps"]),
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+
+def conform_clip_command(path: str, settings: dict, outputfile: str) -> List[str]:
+    """
+    Builds an ffmpeg command that re-encodes the video of a cached clip to
+    the format of a composition, so that it can be joined with the others
+
+    :param path str: Cached clip
+    :param settings dict: Format of the composition, from clip_settings()
+    :param outputfile str: Path to save the clip to
+    :rtype List[str]: ffmpeg arguments
+    """
+    return (
+        [
+            ffmpeg_binary(),
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            # keep the clip's timestamps, so that it lines up with the
+            # cached clips it is joined with
+            "-copyts",
+            "-i",
+            path,
+            "-map",
+            "0",
+        ]
+        + video_args(settings)
+        + ["-c:a", "copy", "-f", "matroska", outputfile]
+    )
+
+
+def create_supercut_cached(
+    composition: List[dict],
+    outputfile: str,
+    cache_dir: str,
+    max_size: int = CLIP_CACHE_SIZE,
+    video: bool = True,
+) -> bool:
+    """
+    Renders a supercut from clips in the cache, encoding only the clips
+    that aren't there yet, and joins them without re-encoding. Clips from
+    sources smaller or slower than the largest one are re-encoded to its
+    format first
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the supercut to
+    :param cache_dir str: Cache folder
+    :param max_size int: Megabytes of clips to keep in the cache
+    :param video bool: Render video with audio, rather than only audio
+    :rtype bool: False if the clips couldn't be rendered
+    """
+    settings = clip_settings(composition, outputfile, video)
+    if settings is None:
+        return False
+
+    print("[+] Rendering clips.")
+    clips = render_clips(composition, cache_dir, settings)
+    if clips is None:
+        return False
+
+    print("[+] Joining clips.")
+    tempdir = tempfile.mkdtemp(
+        prefix=".videogrep", dir=os.path.dirname(os.path.abspath(outputfile))
+    )
+    try:
+        pieces = []
+        for i, (path, duration, clip_format) in enumerate(clips):
+            if clip_format != settings:
+                piece = os.path.join(tempdir, f"clip{i:05d}{settings['ext']}")
+                if not run_ffmpeg(conform_clip_command(path, settings, piece)):
+                    return False
+                path = piece
+                # the clip now ends on a frame of the composition
+                fps = settings["fps"]
+                duration = max(round(duration * fps) / fps, 1 / fps)
+            pieces.append((path, duration))
+        joined = run_ffmpeg(join_command(pieces, outputfile, tempdir))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    evict(cache_dir, max_size)
+    return joined
+
+
+def export_clips_cached(
+    composition: List[dict],
+    outputfile: str,
+    cache_dir: str,
+    max_size: int = CLIP_CACHE_SIZE,
+    video: bool = True,
+) -> bool:
+    """
+    Exports each clip of a composition to its own file, copying them from
+    the cache and encoding only the clips that aren't there yet
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the clips to. Clips are numbered after it
+    :param cache_dir str: Cache folder
+    :param max_size int: Megabytes of clips to keep in the cache
+    :param video bool: Render video with audio, rather than only audio
+    :rtype bool: False if the clips couldn't be rendered
+    """
+    settings = clip_settings(composition, outputfile, video)
+    if settings is None:
+        return False
+
+    clips = render_clips(composition, cache_dir, settings)
+    if clips is None:
+        return False
+
+    basename, ext = os.path.splitext(outputfile)
+    print("[+] Writing output files.")
+    for i, (path, _, _) in enumerate(clips):
+        clipfilename = basename + "_" + str(i).zfill(5) + ext
+        if settings["ext"] == ext.lower():
+            shutil.copyfile(path, clipfilename)
+            continue
+
+        command = [
+            ffmpeg_binary(),
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-map",
+            "0",
+            "-c",
+            "copy",
+            clipfilename,
+        ]
+        if not run_ffmpeg(command):
+            return False
+
+    evict(cache_dir, max_size)
+    return True
+
+
+def evict(cache_dir: str, max_size: int = CLIP_CACHE_SIZE):
+    """
+    Deletes the least recently used rendered clips and decoded audio files
+    until they fit in max_size
+
+    :param cache_dir str: Cache folder
+    :param max_size int: Megabytes of clips and audio to keep
+    """
+    entries = []
+    for category in ["clips", "pcm"]:
+        folder = os.path.join(cache_dir, category)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.startswith(".tmp"):
+                continue
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
@@ -1,16 +1,37 @@
-from moviepy.editor import VideoFileClip
 from typing import List
 from functools import lru_cache
 import os
 
+from .probe import probe
+
 # https://developer.apple.com/library/archive/documentation/AppleApplications/Reference/FinalCutPro_XML/Basics/Basics.html#//apple_ref/doc/uid/TP30001154-DontLinkElementID_60
 
 FPS = 30
 
 
 @lru_cache(maxsize=None)
-def get_clip(filename: str) -> VideoFileClip:
-    return VideoFileClip(filename)
+def get_info(filename: str) -> dict:
+    """
+    Gets the width, height and duration of a file, from probe() if
+    possible, or else by opening it with moviepy
+
+    :param filename str: Media file path
+    :rtype dict: {width, height, duration}
+    """
+    info = probe(filename)
+    if info is not None and info["video"] is not None and info["duration"]:
+        return {
+            "width": info["video"]["width"],
+            "height": info["video"]["height"],
+            "duration": info["duration"],
+        }
+
+    from moviepy.editor import VideoFileClip
+
+    clip = VideoFileClip(filename)
+    info = {"width": clip.w, "height": clip.h, "duration": clip.duration}
+    clip.close()
+    return info
 
 
 def frames(seconds: float, fps: float) -> int:
@@ -47,16 +68,16 @@ class Clip:
         clip_in: float,
         clip_out: float,
     ):
-        self.clip = get_clip(filename)
+        self.info = get_info(filename)
         self.full_path = os.path.abspath(filename)
         self.base_path = os.path.basename(filename)
         self.shot_name = os.path.basename(filename)
         self.clip_id = f"{self.shot_name}-{clip_id}"
         self.audio_clip_id = f"{self.clip_id}-audio"
         self.fps = FPS
-        self.width = self.clip.w
-        self.height = self.clip.h
-        self.duration = self.frames(self.clip.duration)
+        self.width = self.info["width"]
+        self.height = self.info["height"]
+        self.duration = self.frames(self.info["duration"])
         self.start = self.frames(start)
         self.end = self.frames(end)
         self.clip_in = self.frames(clip_in)
@@ -0,0 +1,369 @@
+import os
+import re
+import sqlite3
+from typing import Optional, List, Dict, Tuple, Set
+from .transcript import Transcript
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    transcript TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    word_level INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    word TEXT UNIQUE NOT NULL,
+    folded TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    file_id INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (file_id, sentence)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    word_id INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    sentence INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    word_id INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    sentence INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS words_folded ON words (folded);
+CREATE INDEX IF NOT EXISTS postings_word ON postings (word_id, file_id);
+CREATE INDEX IF NOT EXISTS postings_position ON postings (file_id, position);
+CREATE INDEX IF NOT EXISTS terms_word ON terms (word_id, file_id);
+"""
+
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+def is_literal(query: str) -> bool:
+    """
+    Checks if a query contains no regular expression syntax
+
+    :param query str: Query
+    :rtype bool: True if the query only matches itself
+    """
+    return not any(c in REGEX_CHARS for c in query)
+
+
+class Index:
+    """
+    A persistent positional word index stored in sqlite.
+
+    Words are mapped to the file, sentence, word offset and start/end times
+    they appear at, so searches only touch the parts of the corpus that can
+    match. Transcripts are only re-indexed when their mtime or size changes.
+
+    :param path str: Path to the index database
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self._vocabulary: Optional[List[Tuple[int, str]]] = None
+        self._word_ids: Optional[Dict[str, int]] = None
+        self._matches: Dict[Tuple[str, bool], Set[int]] = {}
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def lookup(self, subfile: str) -> Optional[int]:
+        """
+        Gets the id of an indexed transcript, if it hasn't changed since it was indexed
+
+        :param subfile str: Transcript file path
+        :rtype Optional[int]: The file id, or None if the transcript needs to be (re-)indexed
+        """
+        subfile = os.path.abspath(subfile)
+        stat = os.stat(subfile)
+        row = self.db.execute(
+            "SELECT id, mtime, size FROM files WHERE transcript = ?", (subfile,)
+        ).fetchone()
+        if row is not None and row[1] == stat.st_mtime_ns and row[2] == stat.st_size:
+            return row[0]
+        return None
+
+    def update(self, subfile: str, transcript: Transcript) -> int:
+        """
+        Adds a parsed transcript to the index, replacing any previous entries for it
+
+        :param subfile str: Transcript file path
+        :param transcript Transcript: Parsed transcript
+        :rtype int: The file id of the transcript
+        """
+        subfile = os.path.abspath(subfile)
+        stat = os.stat(subfile)
+        word_level = transcript.word_level
+
+        with self.db:
+            row = self.db.execute(
+                "SELECT id FROM files WHERE transcript = ?", (subfile,)
+            ).fetchone()
+            if row is not None:
+                file_id = row[0]
+                self.db.execute("DELETE FROM sentences WHERE file_id = ?", (file_id,))
+                self.db.execute("DELETE FROM postings WHERE file_id = ?", (file_id,))
+                self.db.execute("DELETE FROM terms WHERE file_id = ?", (file_id,))
+                self.db.execute(
+                    "UPDATE files SET mtime = ?, size = ?, word_level = ? WHERE id = ?",
+                    (stat.st_mtime_ns, stat.st_size, word_level, file_id),
+                )
+            else:
+                file_id = self.db.execute(
+                    "INSERT INTO files (transcript, mtime, size, word_level) VALUES (?, ?, ?, ?)",
+                    (subfile, stat.st_mtime_ns, stat.st_size, word_level),
+                ).lastrowid
+
+            sentences = []
+            postings = []
+            terms = []
+            for i, content in enumerate(transcript.contents):
+                sentences.append(
+                    (file_id, i, transcript.start(i), transcript.end(i), content)
+                )
+                for term in set(content.split()):
+                    terms.append((self._word_id(term), file_id, i))
+                if word_level:
+                    for position in range(
+                        transcript.offsets[i], transcript.offsets[i + 1]
+                    ):
+                        postings.append(
+                            (
+                                self._word_id(transcript.word(position)),
+                                file_id,
+                                i,
+                                position,
+                                transcript.starts[position],
+                                transcript.ends[position],
+                            )
+                        )
+
+            self.db.executemany(
+                "INSERT INTO sentences VALUES (?, ?, ?, ?, ?)", sentences
+            )
+            self.db.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?)", postings
+            )
+            self.db.executemany("INSERT INTO terms VALUES (?, ?, ?)", terms)
+
+        return file_id
+
+    def _word_id(self, word: str) -> int:
+        if self._word_ids is None:
+            self._word_ids = dict(
+                (w, i) for i, w in self.db.execute("SELECT id, word FROM words")
+            )
+        if word not in self._word_ids:
+            self._vocabulary = None
+            self._matches = {}
+            self._word_ids[word] = self.db.execute(
+                "INSERT INTO words (word, folded) VALUES (?, ?)", (word, word.lower())
+            ).lastrowid
+        return self._word_ids[word]
+
+    def vocabulary(self) -> List[Tuple[int, str]]:
+        """
+        All distinct words in the index
+
+        :rtype List[Tuple[int, str]]: List of (word id, word)
+        """
+        if self._vocabulary is None:
+            self._vocabulary = self.db.execute("SELECT id, word FROM words").fetchall()
+        return self._vocabulary
+
+    def matching_words(self, pattern: str, literal: bool = False) -> Set[int]:
+        """
+        Finds the ids of all words matching a regular expression, or
+        containing a literal string. Results are kept until new words are
+        added, so the vocabulary is scanned once per query rather than once
+        per file.
+
+        :param pattern str: Regular expression, or a literal string
+        :param literal bool: Match words containing pattern, rather than the regular expression
+        :rtype Set[int]: Word ids
+        """
+        key = (pattern, literal)
+        if key not in self._matches:
+            if literal:
+                found = set(i for i, w in self.vocabulary() if pattern in w)
+            else:
+                regex = re.compile(pattern)
+                found = set(i for i, w in self.vocabulary() if regex.search(w))
+            self._matches[key] = found
+        return self._matches[key]
+
+    def is_word_level(self, file_id: int) -> bool:
+        row = self.db.execute(
+            "SELECT word_level FROM files WHERE id = ?", (file_id,)
+        ).fetchone()
+        return bool(row[0])
+
+    def sentences(
+        self, file_id: int, candidates: Optional[Set[int]] = None
+    ) -> List[Tuple[int, float, float, str]]:
+        """
+        Returns the sentences of a transcript, optionally limited to a set of sentence numbers
+
+        :param file_id int: File id
+        :param candidates Optional[Set[int]]: Sentence numbers to fetch
+        :rtype List[Tuple[int, float, float, str]]: List of (sentence, start, end, content)
+        """
+        if candidates is None:
+            return self.db.execute(
+                "SELECT sentence, start, end, content FROM sentences "
+                "WHERE file_id = ? ORDER BY sentence",
+                (file_id,),
+            ).fetchall()
+
+        rows = []
+        for chunk in _chunks(sorted(candidates)):
+            rows += self.db.execute(
+                "SELECT sentence, start, end, content FROM sentences "
+                "WHERE file_id = ? AND sentence IN (%s)" % ",".join("?" * len(chunk)),
+                [file_id] + chunk,
+            ).fetchall()
+        return sorted(rows)
+
+    def candidate_sentences(
+        self, file_ids: List[int], query: str
+    ) -> Optional[Dict[int, Set[int]]]:
+        """
+        Narrows down the sentences that can match a sentence query, in a set
+        of files. Only literal queries can be narrowed down, since each
+        whitespace separated part of the query must be contained in a word of
+        the sentence.
+
+        :param file_ids List[int]: File ids
+        :param query str: Query
+        :rtype Optional[Dict[int, Set[int]]]: Sentence numbers by file id, leaving out files without candidates, or None if every sentence is a candidate
+        """
+        parts = query.split()
+        if not is_literal(query) or len(parts) == 0:
+            return None
+
+        candidates: Optional[Set[Tuple[int, int]]] = None
+        for part in parts:
+            found = set(
+                self._rows(
+                    "SELECT file_id, sentence FROM terms",
+                    self.matching_words(part, literal=True),
+                    file_ids,
+                )
+            )
+            candidates = found if candidates is None else candidates & found
+            if len(candidates) == 0:
+                break
+
+        by_file: Dict[int, Set[int]] = {}
+        for file_id, sentence in candidates or []:
+            by_file.setdefault(file_id, set()).add(sentence)
+        return by_file
+
+    def fragments(
+        self, file_ids: List[int], queries: List[str]
+    ) -> Dict[int, List[dict]]:
+        """
+        Finds consecutive words matching a list of per-word regular
+        expressions, in a set of files. The postings of each word of the
+        query are fetched once for all files, and joined on their positions.
+
+        :param file_ids List[int]: File ids
+        :param queries List[str]: One regular expression per word
+        :rtype Dict[int, List[dict]]: Lists of {start, end, content} in order, by file id, leaving out files without matches
+        """
+        if len(queries) == 0:
+            return {}
+
+        matching = [self.matching_words(q) for q in queries]
+        if any(len(m) == 0 for m in matching):
+            return {}
+
+        # (file id, position) -> (start, end, word id) of each word of the query
+        postings = []
+        starts = None
+        for k, word_ids in enumerate(matching):
+            found = dict(
+                ((file_id, position - k), (start, end, word_id))
+                for file_id, position, start, end, word_id in self._rows(
+                    "SELECT file_id, position, start, end, word_id FROM postings",
+                    word_ids,
+                    file_ids if starts is None else sorted(set(f for f, _ in starts)),
+                )
+            )
+            starts = set(found) if starts is None else starts & set(found)
+            postings.append(found)
+            if len(starts) == 0:
+                return {}
+
+        words = dict(self.vocabulary())
+        out: Dict[int, List[dict]] = {}
+        for file_id, position in sorted(starts):
+            fragment = [found[(file_id, position)] for found in postings]
+            out.setdefault(file_id, []).append(
+                {
+                    "start": fragment[0][0],
+                    "end": fragment[-1][1],
+                    "content": " ".join(words[f[2]] for f in fragment),
+                }
+            )
+        return out
+
+    def _rows(self, select: str, word_ids: Set[int], file_ids: List[int]) -> list:
+        """Runs a query on the rows of a table for a set of words in a set of files"""
+        rows = []
+        for word_chunk in _chunks(sorted(word_ids), 250):
+            for file_chunk in _chunks(file_ids, 250):
+                rows += self.db.execute(
+                    select
+                    + " WHERE word_id IN (%s) AND file_id IN (%s)"
+                    % (
+                        ",".join("?" * len(word_chunk)),
+                        ",".join("?" * len(file_chunk)),
+                    ),
+                    word_chunk + file_chunk,
+                ).fetchall()
+        return rows
+
+    def occurrences(
+        self, word: str, file_ids: List[int]
+    ) -> List[Tuple[int, float, float, str]]:
+        """
+        Finds every occurrence of a word in a set of files, ignoring case
+
+        :param word str: Word to look for
+        :param file_ids List[int]: Files to look in
+        :rtype List[Tuple[int, float, float, str]]: List of (file id, start, end, word)
+        """
+        rows = []
+        for chunk in _chunks(file_ids):
+            rows += self.db.execute(
+                "SELECT postings.file_id, postings.start, postings.end, words.word "
+                "FROM postings JOIN words ON words.id = postings.word_id "
+                "WHERE words.folded = ? AND postings.file_id IN (%s)"
+                % ",".join("?" * len(chunk)),
+                [word.lower()] + chunk,
+            ).fetchall()
+        return rows
+
+
+def _chunks(items: list, size: int = 500) -> List[list]:
+    """Splits a list to stay below sqlite's limit on query parameters"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,319 @@
+import re
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, Set, Tuple, Optional
+
+from .index import is_literal
+
+try:
+    import re._parser as sre_parse  # type: ignore
+    import re._constants as sre_constants  # type: ignore
+except ImportError:
+    import sre_parse  # type: ignore
+    import sre_constants  # type: ignore
+
+# backreferences would point at the wrong group once queries are combined
+BACKREFERENCE = re.compile(r"\\[1-9]|\\g<|\(\?P=")
+
+# flags every pattern gets. Others come from inline flags like (?i), which
+# older pythons apply to the whole pattern they are part of
+DEFAULT_FLAGS = re.compile("").flags
+
+REPEATS = set(
+    getattr(sre_constants, op)
+    for op in ["MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"]
+    if hasattr(sre_constants, op)
+)
+
+
+def required_literals(pattern: re.Pattern) -> List[str]:
+    """
+    Extracts strings that every match of a regular expression must contain.
+    For example r"\bclimate (change|crisis)\b" requires "climate ". For case
+    insensitive patterns only ascii strings are returned, in lower case.
+
+    :param pattern re.Pattern: Compiled regular expression
+    :rtype List[str]: Required strings
+    """
+    if not isinstance(pattern.pattern, str):
+        return []
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, RecursionError):
+        return []
+
+    literals = _required_literals(parsed)
+
+    if pattern.flags & re.IGNORECASE:
+        literals = [l.lower() for l in literals if l.isascii()]
+
+    return [l for l in literals if l != ""]
+
+
+def _required_literals(parsed) -> List[str]:
+    literals = []
+    current: List[str] = []
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(av))
+            continue
+
+        # anchors like ^ or \b don't consume any text
+        if op is sre_constants.AT:
+            continue
+
+        literals.append("".join(current))
+        current = []
+
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, p = av
+            # skip groups that change case sensitivity
+            if (add_flags | del_flags) & re.IGNORECASE == 0:
+                literals += _required_literals(p)
+        elif op in REPEATS:
+            minimum, _, p = av
+            if minimum >= 1:
+                literals += _required_literals(p)
+
+    literals.append("".join(current))
+    return literals
+
+
+def scan_pattern(query: str) -> Optional[re.Pattern]:
+    """
+    Compiles a query for searching a whole transcript at once, with one
+    sentence per line. Queries whose matches can depend on text outside of
+    their sentence, like lookarounds or \\A and \\Z, can't be.
+
+    :param query str: Query as a regular expression
+    :rtype Optional[re.Pattern]: Pattern compiled with re.MULTILINE, or None
+    """
+    try:
+        parsed = sre_parse.parse(query)
+    except (re.error, RecursionError):
+        return None
+
+    if not _scannable(parsed):
+        return None
+
+    return re.compile(query, re.MULTILINE)
+
+
+def _scannable(parsed) -> bool:
+    for op, av in parsed:
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            return False
+        if op is sre_constants.AT and av in (
+            sre_constants.AT_BEGINNING_STRING,
+            sre_constants.AT_END_STRING,
+        ):
+            return False
+        for item in av if isinstance(av, (tuple, list)) else [av]:
+            if isinstance(item, list):
+                # ie. the alternatives of a branch
+                if not all(_scannable(p) for p in item if hasattr(p, "data")):
+                    return False
+            elif hasattr(item, "data") and not _scannable(item):
+                return False
+    return True
+
+
+def fold(text: str) -> str:
+    """
+    Case-normalizes text for comparing with the lowercase literals of a case
+    insensitive pattern. The dotless i and dotted capital I match "i" in case
+    insensitive patterns, but don't case fold to it, so they get replaced.
+
+    :param text str: Text
+    :rtype str: Normalized text
+    """
+    text = text.casefold()
+    if "\u0131" in text or "\u0307" in text:
+        text = text.replace("\u0131", "i").replace("\u0307", "")
+    return text
+
+
+class QueryPlan:
+    """
+    A compiled query, plus the strings any match must contain. Texts that
+    don't contain them are rejected with a quick substring check before the
+    regular expression is run.
+
+    :param query str: Query as a regular expression
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.pattern = re.compile(query)
+        self.ignorecase = bool(self.pattern.flags & re.IGNORECASE)
+        self.literals = required_literals(self.pattern)
+
+    def possible(self, text: str, folded: Optional[str] = None) -> bool:
+        """
+        Checks if a text contains all the required strings
+
+        :param text str: Text
+        :param folded Optional[str]: The text, case-normalized with fold()
+        :rtype bool: False if the query can't match the text
+        """
+        if self.ignorecase:
+            if folded is None:
+                folded = fold(text)
+            text = folded
+        for literal in self.literals:
+            if literal not in text:
+                return False
+        return True
+
+    def search(self, text: str, folded: Optional[str] = None) -> bool:
+        """
+        Checks if the query matches a text
+
+        :param text str: Text
+        :param folded Optional[str]: The text, case-normalized with fold()
+        :rtype bool: True if the query matches
+        """
+        return self.possible(text, folded) and self.pattern.search(text) is not None
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton that finds which of many literal strings occur in
+    a text in a single pass over the text.
+
+    :param patterns List[str]: Literal strings to look for
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[int]] = [set()]
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(index)
+
+        # breadth first, so that fail links always point to shallower states
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text: str) -> Set[int]:
+        """
+        Finds the patterns that occur in a text
+
+        :param text str: Text to search
+        :rtype Set[int]: Indexes of the patterns found
+        """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        found = set(output[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class QueryMatcher:
+    """
+    Matches text against a set of queries at once.
+
+    Literal queries are matched with an Aho-Corasick automaton. Otherwise
+    each query is planned with the strings it requires, and the queries are
+    combined into one alternation with a named group per query, so that
+    sentences matching none of the queries are rejected with substring
+    checks or a single regex pass. Only sentences that match are checked
+    against each query to find every query that matches.
+
+    :param queries List[str]: Queries as regular expressions
+    """
+
+    def __init__(self, queries: List[str]):
+        self.queries = queries
+        self.plans = [QueryPlan(q) for q in queries]
+        self.automaton = None
+        self.combined = None
+        self.needs_folding = any(p.ignorecase and p.literals for p in self.plans)
+
+        if len(queries) > 1 and all(is_literal(q) for q in queries):
+            self.automaton = AhoCorasick(queries)
+        elif (
+            len(queries) > 1
+            and not any(BACKREFERENCE.search(q) for q in queries)
+            and all(p.pattern.flags == DEFAULT_FLAGS for p in self.plans)
+        ):
+            try:
+                self.combined = re.compile(
+                    "|".join(f"(?P<q{i}>{q})" for i, q in enumerate(queries))
+                )
+            except re.error:
+                # ie. clashing group names
+                self.combined = None
+
+    def matches(self, text: str, stats: Optional[dict] = None) -> List[int]:
+        """
+        Finds every query that matches a text
+
+        :param text str: Text to search
+        :param stats Optional[dict]: Adds to the counts of "candidates" checked and "pruned" by the literal prefilter
+        :rtype List[int]: Indexes of the matching queries, in order
+        """
+        if stats is not None:
+            stats["candidates"] = stats.get("candidates", 0) + 1
+
+        if self.automaton is not None:
+            return sorted(self.automaton.search(text))
+
+        folded = fold(text) if self.needs_folding else None
+        possible = [i for i, p in enumerate(self.plans) if p.possible(text, folded)]
+
+        if len(possible) == 0:
+            if stats is not None:
+                stats["pruned"] = stats.get("pruned", 0) + 1
+            return []
+
+        if self.combined is not None:
+            match = self.combined.search(text)
+            if match is None:
+                return []
+            first = int(match.lastgroup[1:])
+            return [
+                i for i in possible if i == first or self.plans[i].pattern.search(text)
+            ]
+
+        return [i for i in possible if self.plans[i].pattern.search(text)]
+
+
+@lru_cache(maxsize=32)
+def compile_queries(queries: Tuple[str, ...]) -> QueryMatcher:
+    """
+    Builds a QueryMatcher, reusing it for repeated searches with the same queries
+
+    :param queries Tuple[str, ...]: Queries as regular expressions
+    :rtype QueryMatcher: Matcher for the queries
+    """
+    return QueryMatcher(list(queries))
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import subprocess
+from typing import List, Optional
+
+import numpy as np
+
+from . import cache
+from .probe import ffmpeg_binary
+from .render import run_ffmpeg, SAMPLE_RATE, CHANNELS
+
+
+def decode(filename: str, folder: str) -> Optional[str]:
+    """
+    Decodes the audio of a file to raw 16 bit samples. The result is named
+    after the file and its modification time, so a folder can be used as a
+    cache that is refreshed when files change.
+
+    :param filename str: Media file path
+    :param folder str: Folder to save the samples to
+    :rtype Optional[str]: Path to the samples, or None if ffmpeg failed
+    """
+    filename = os.path.abspath(filename)
+    key = repr((filename, cache.file_stamp(filename), SAMPLE_RATE, CHANNELS))
+    path = cache.cache_path(folder, "pcm", key, ".pcm")
+    if os.path.exists(path):
+        # mark the entry as recently used
+        os.utime(path)
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+    os.close(fd)
+    command = [
+        ffmpeg_binary(),
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        filename,
+        "-map",
+        "0:a:0",
+        "-ac",
+        str(CHANNELS),
+        "-ar",
+        str(SAMPLE_RATE),
+        "-f",
+        "s16le",
+        tmpname,
+    ]
+    if not run_ffmpeg(command):
+        os.remove(tmpname)
+        return None
+
+    os.replace(tmpname, path)
+    return path
+
+
+def load(path: str) -> np.ndarray:
+    """
+    Maps decoded samples into memory without reading them
+
+    :param path str: Path to samples from decode()
+    :rtype np.ndarray: Array of shape (samples, channels)
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, CHANNELS), dtype="<i2")
+    return np.memmap(path, dtype="<i2", mode="r").reshape(-1, CHANNELS)
+
+
+def create_supercut_pcm(
+    composition: List[dict], outputfile: str, cache_dir: str
+) -> bool:
+    """
+    Concatenates the audio of clips. Each file is decoded once to the cache,
+    where later supercuts can reuse it, and the samples of each clip are
+    written from the mapped file straight to a single ffmpeg encoder.
+    Decoded audio takes about 635MB per hour of source, so this is only
+    worth it when the same files are used again.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the audio to
+    :param cache_dir str: Folder to keep decoded files in
+    :rtype bool: False if a file couldn't be decoded, or ffmpeg failed
+    """
+
+    all_filenames = sorted(set([c["file"] for c in composition]))
+
+    try:
+        print("[+] Decoding audio.")
+        samples = {}
+        for f in all_filenames:
+            path = decode(f, cache_dir)
+            if path is None:
+                return False
+            samples[f] = load(path)
+
+        print("[+] Writing output file.")
+        command = [
+            ffmpeg_binary(),
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "s16le",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-ac",
+            str(CHANNELS),
+            "-i",
+            "-",
+            outputfile,
+        ]
+        # the log goes to a file, since a full stderr pipe would block the
+        # encoder while it is being written to
+        with tempfile.TemporaryFile() as log:
+            encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=log)
+            try:
+                for c in composition:
+                    data = samples[c["file"]]
+                    start = min(max(round(c["start"] * SAMPLE_RATE), 0), len(data))
+                    end = min(max(round(c["end"] * SAMPLE_RATE), start), len(data))
+                    encoder.stdin.write(data[start:end].data)
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            encoder.wait()
+
+            if encoder.returncode != 0:
+                log.seek(0)
+                print(log.read().decode("utf8", errors="replace").strip())
+                return False
+        return True
+    finally:
+        # release the mapped files
+        samples = None
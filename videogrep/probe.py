@@ -0,0 +1,329 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+from fractions import Fraction
+from functools import lru_cache
+from typing import Optional, List
+
+from . import cache
+
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6}
+
+# folder to keep probe results in between runs, see set_cache_dir()
+CACHE_DIR = None
+
+
+def set_cache_dir(cache_dir: Optional[str]) -> Optional[str]:
+    """
+    Keeps the results of probe() and keyframes() in a folder, so that later
+    runs don't need to read the files again. Results are refreshed when a
+    file changes. Returns the folder that was used before, so it can be
+    restored.
+
+    :param cache_dir Optional[str]: Cache folder, or None to only keep results in memory
+    """
+    global CACHE_DIR
+    previous = CACHE_DIR
+    CACHE_DIR = cache_dir
+    return previous
+
+
+def ffmpeg_binary() -> str:
+    """The ffmpeg executable moviepy is configured to use"""
+    from moviepy.config import get_setting
+
+    return get_setting("FFMPEG_BINARY")
+
+
+def ffprobe_binary() -> Optional[str]:
+    """The ffprobe executable, if one is installed"""
+    return shutil.which("ffprobe")
+
+
+def probe(filename: str) -> Optional[dict]:
+    """
+    Reads the duration and the format of the first video and audio streams
+    of a media file. Uses ffprobe if it is installed, otherwise parses the
+    output of ffmpeg. Results are reused until the file changes.
+
+    :param filename str: Media file path
+    :rtype Optional[dict]: {duration, video: {codec, profile, width, height, pix_fmt, fps}, audio: {codec, sample_rate, channels}}, or None if the file can't be read
+    """
+    if not os.path.exists(filename):
+        return None
+    return _probe(os.path.abspath(filename), cache.file_stamp(filename))
+
+
+@lru_cache(maxsize=256)
+def _probe(filename: str, stamp: tuple) -> Optional[dict]:
+    if CACHE_DIR is not None:
+        info = cache.load(CACHE_DIR, "probes", filename, stamp)
+        if info is not None:
+            return info
+
+    if ffprobe_binary() is not None:
+        info = _ffprobe(filename)
+    else:
+        info = _ffmpeg_probe(filename)
+
+    if info is not None and CACHE_DIR is not None:
+        cache.save(CACHE_DIR, "probes", filename, stamp, info)
+    return info
+
+
+def _ffprobe(filename: str) -> Optional[dict]:
+    result = subprocess.run(
+        [
+            ffprobe_binary(),
+            "-v",
+            "error",
+            "-show_format",
+            "-show_streams",
+            "-of",
+            "json",
+            filename,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return None
+
+    data = json.loads(result.stdout)
+    info = {"duration": None, "video": None, "audio": None}
+
+    if "duration" in data.get("format", {}):
+        info["duration"] = float(data["format"]["duration"])
+
+    for stream in data.get("streams", []):
+        kind = stream.get("codec_type")
+        # cover art in audio files shows up as a video stream
+        if stream.get("disposition", {}).get("attached_pic"):
+            continue
+        if kind == "video" and info["video"] is None:
+            fps = None
+            if stream.get("r_frame_rate", "0/0") != "0/0":
+                fps = round(float(Fraction(stream["r_frame_rate"])), 3)
+            width = stream.get("width")
+            height = stream.get("height")
+            rotation = stream.get("tags", {}).get("rotate", 0)
+            for side_data in stream.get("side_data_list", []):
+                rotation = side_data.get("rotation", rotation)
+            if int(float(rotation)) % 180 != 0:
+                width, height = height, width
+            info["video"] = {
+                "codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "width": width,
+                "height": height,
+                "pix_fmt": stream.get("pix_fmt"),
+                "fps": fps,
+                "b_frames": stream.get("has_b_frames", 0) > 0,
+            }
+        elif kind == "audio" and info["audio"] is None:
+            info["audio"] = {
+                "codec": stream.get("codec_name"),
+                "sample_rate": int(stream.get("sample_rate", 0)) or None,
+                "channels": stream.get("channels"),
+            }
+
+    return info
+
+
+VIDEO_STREAM = re.compile(
+    r"Stream #\d+:\d+.*?: Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)(?:\([^)]*\))?, (\d+)x(\d+)"
+)
+AUDIO_STREAM = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+).*?, (\d+) Hz, ([^,]+)")
+FPS = re.compile(r", ([\d.]+) fps")
+ROTATION = re.compile(r"rotat(?:e\s*:\s*|ion of )(-?[\d.]+)")
+DURATION = re.compile(r"Duration: (\d+):(\d+):([\d.]+)")
+
+
+def _ffmpeg_probe(filename: str) -> Optional[dict]:
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-i", filename],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    output = result.stderr.decode("utf8", errors="replace")
+    if "Input #0" not in output:
+        return None
+
+    info = {"duration": None, "video": None, "audio": None}
+
+    duration = DURATION.search(output)
+    if duration is not None:
+        hours, minutes, seconds = duration.groups()
+        info["duration"] = int(hours) * 60 * 60 + int(minutes) * 60 + float(seconds)
+
+    rotation = ROTATION.search(output)
+    rotated = rotation is not None and int(float(rotation.group(1))) % 180 != 0
+
+    for line in output.splitlines():
+        video = VIDEO_STREAM.search(line)
+        # cover art in audio files shows up as a video stream
+        if video is not None and "(attached pic)" in line:
+            video = None
+        if video is not None and info["video"] is None:
+            fps = FPS.search(line)
+            width = int(video.group(4))
+            height = int(video.group(5))
+            if rotated:
+                width, height = height, width
+            info["video"] = {
+                "codec": video.group(1),
+                "profile": video.group(2),
+                "width": width,
+                "height": height,
+                "pix_fmt": video.group(3),
+                "fps": round(float(fps.group(1)), 3) if fps else None,
+                "b_frames": _b_frames(filename),
+            }
+
+        audio = AUDIO_STREAM.search(line)
+        if audio is not None and info["audio"] is None:
+            layout = audio.group(3).strip()
+            channels = CHANNEL_LAYOUTS.get(layout)
+            if layout.endswith(" channels"):
+                channels = int(layout.split(" ")[0])
+            info["audio"] = {
+                "codec": audio.group(1),
+                "sample_rate": int(audio.group(2)),
+                "channels": channels,
+            }
+
+    return info
+
+
+def _b_frames(filename: str, packets: int = 100) -> bool:
+    """
+    Checks if the first video stream of a file uses B-frames, which ffmpeg
+    only reports through ffprobe. Frames are stored out of order when it
+    does, so the first packets will have differing decode and presentation
+    times.
+    """
+    result = subprocess.run(
+        [
+            ffmpeg_binary(),
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            filename,
+            "-map",
+            "0:v:0",
+            "-c",
+            "copy",
+            "-frames:v",
+            str(packets),
+            "-f",
+            "framecrc",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    for line in result.stdout.decode("utf8", errors="replace").splitlines():
+        fields = [f.strip() for f in line.split(",")]
+        if line.startswith("#") or len(fields) < 3:
+            continue
+        if fields[1] != fields[2]:
+            return True
+    return False
+
+
+def keyframes(filename: str) -> Optional[List[float]]:
+    """
+    Finds the timestamps of the keyframes of the first video stream of a
+    file. Only keyframes are decoded, so this is fast even for long videos.
+
+    :param filename str: Video file path
+    :rtype Optional[List[float]]: Keyframe times in seconds, in order, or None if they can't be read
+    """
+    return _keyframes(os.path.abspath(filename), cache.file_stamp(filename))
+
+
+@lru_cache(maxsize=256)
+def _keyframes(filename: str, stamp: tuple) -> Optional[List[float]]:
+    if CACHE_DIR is not None:
+        keys = cache.load(CACHE_DIR, "keyframes", filename, stamp)
+        if keys is not None:
+            return keys
+
+    keys = _read_keyframes(filename)
+    if keys is not None and CACHE_DIR is not None:
+        cache.save(CACHE_DIR, "keyframes", filename, stamp, keys)
+    return keys
+
+
+def _pts_times(output: str) -> List[float]:
+    """
+    Reads the times ffprobe printed, one per line. Frames without a
+    timestamp are listed as N/A and skipped
+
+    :param output str: Output of ffprobe -show_entries frame=pts_time
+    """
+    times = []
+    for line in output.split():
+        try:
+            times.append(float(line.strip(",")))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def _read_keyframes(filename: str) -> Optional[List[float]]:
+    if ffprobe_binary() is not None:
+        result = subprocess.run(
+            [
+                ffprobe_binary(),
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-skip_frame",
+                "nokey",
+                "-show_entries",
+                "frame=pts_time",
+                "-of",
+                "csv=p=0",
+                filename,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        if result.returncode != 0:
+            return None
+        return _pts_times(result.stdout.decode("utf8"))
+
+    # showinfo prints a line for every frame that gets decoded
+    result = subprocess.run(
+        [
+            ffmpeg_binary(),
+            "-hide_banner",
+            "-skip_frame",
+            "nokey",
+            "-i",
+            filename,
+            "-map",
+            "0:v:0",
+            "-vf",
+            "showinfo",
+            "-f",
+            "null",
+            "-",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        return None
+
+    output = result.stderr.decode("utf8", errors="replace")
+    return sorted(
+        float(time)
+        for time, key in re.findall(r"pts_time:([-\d.]+).*?iskey:(\d)", output)
+        if key == "1"
+    )
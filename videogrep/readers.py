@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from typing import List
+
+from moviepy.editor import VideoFileClip, AudioFileClip, VideoClip, AudioClip
+
+from .probe import probe
+from .render import SAMPLE_RATE, CHANNELS
+
+# most files to keep open at once. moviepy runs an ffmpeg process for the
+# video and another for the audio of each open file
+READER_POOL_SIZE = 16
+
+
+def group_by_source(composition: List[dict]) -> List[int]:
+    """
+    Orders the clips of a composition by the file they come from, keeping
+    the order of clips from the same file
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :rtype List[int]: Indexes of the clips in the composition
+    """
+    return sorted(range(len(composition)), key=lambda i: composition[i]["file"])
+
+
+class ReaderPool:
+    """
+    Opens media files with moviepy when they are needed, and keeps at most
+    size of them open. Opening another file closes the one that was used
+    least recently, so a supercut drawn from hundreds of files doesn't run
+    out of processes or file descriptors.
+
+    :param size int: Most files to keep open at once
+    :param audio_only bool: Open files as audio, rather than as video with audio
+    """
+
+    def __init__(self, size: int = READER_POOL_SIZE, audio_only: bool = False):
+        self.size = max(size, 1)
+        self.audio_only = audio_only
+        self.clips = OrderedDict()
+        self.opened = 0
+
+    def get(self, filename: str):
+        """
+        Returns a file opened with moviepy, opening it if necessary
+
+        :param filename str: Media file path
+        :rtype Union[VideoFileClip, AudioFileClip]: The opened file
+        """
+        if filename in self.clips:
+            self.clips.move_to_end(filename)
+            return self.clips[filename]
+
+        while len(self.clips) >= self.size:
+            _, clip = self.clips.popitem(last=False)
+            clip.close()
+
+        if self.audio_only:
+            clip = AudioFileClip(filename)
+        else:
+            clip = VideoFileClip(filename)
+        self.clips[filename] = clip
+        self.opened += 1
+        return clip
+
+    def cut(self, composition: List[dict]) -> list:
+        """
+        Cuts every clip of a composition, with start and end times clamped
+        to the file. The clips read their frames through the pool, so a file
+        only needs to be open while its clips are being rendered. The format
+        of each file is read with probe(), so no file is opened here.
+
+        :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+        :rtype list: moviepy clips, in the order of the composition
+        """
+        clips = [None] * len(composition)
+        for i in group_by_source(composition):
+            c = composition[i]
+            source = self.source(c["file"])
+            if c["start"] < 0:
+                c["start"] = 0
+            if c["end"] > source["duration"]:
+                c["end"] = source["duration"]
+            clips[i] = self.subclip(c["file"], c["start"], c["end"])
+        return clips
+
+    def source(self, filename: str) -> dict:
+        """
+        Reads the duration, size, frame rate and audio of a file, from
+        probe() if possible, or else by opening it
+
+        :param filename str: Media file path
+        :rtype dict: {duration, size, fps, audio}
+        """
+        info = probe(filename)
+        if info is not None and info["duration"] is not None:
+            if self.audio_only and info["audio"] is not None:
+                return {"duration": info["duration"], "audio": True}
+            video = info["video"]
+            if video is not None and video["width"] and video["fps"]:
+                return {
+                    "duration": info["duration"],
+                    "size": (video["width"], video["height"]),
+                    "fps": video["fps"],
+                    "audio": info["audio"] is not None,
+                }
+
+        clip = self.get(filename)
+        if self.audio_only:
+            return {"duration": clip.duration, "audio": True}
+        return {
+            "duration": clip.duration,
+            "size": clip.size,
+            "fps": clip.fps,
+            "audio": clip.audio is not None,
+        }
+
+    def subclip(self, filename: str, start: float, end: float):
+        """
+        Cuts part of a file, as a clip that reads from the pool
+
+        :param filename str: Media file path
+        :param start float: Start in seconds
+        :param end float: End in seconds
+        :rtype Union[VideoClip, AudioClip]: The clip
+        """
+        source = self.source(filename)
+
+        if self.audio_only:
+            return self._audio_subclip(filename, start, end)
+
+        clip = VideoClip()
+        clip.make_frame = lambda t: self.get(filename).get_frame(start + t)
+        clip.size = source["size"]
+        clip.fps = source["fps"]
+        if source["audio"]:
+            clip.audio = self._audio_subclip(filename, start, end)
+        return clip.set_duration(end - start)
+
+    def _audio_subclip(self, filename: str, start: float, end: float):
+        def make_frame(t):
+            clip = self.get(filename)
+            if not self.audio_only:
+                clip = clip.audio
+            return clip.get_frame(start + t)
+
+        # moviepy decodes audio to this format unless told otherwise
+        audio = AudioClip()
+        audio.make_frame = make_frame
+        audio.fps = SAMPLE_RATE
+        audio.nchannels = CHANNELS
+        return audio.set_duration(end - start)
+
+    def close(self):
+        """Closes every open file"""
+        while len(self.clips) > 0:
+            _, clip = self.clips.popitem()
+            clip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
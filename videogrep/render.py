@@ -0,0 +1,756 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from .probe import probe, keyframes, ffmpeg_binary
+
+# containers the cut clips can be joined into without re-encoding
+COPY_FORMATS = [".mp4", ".mov", ".m4v", ".mkv", ".ts"]
+
+# keyframes this close to the start of a clip are treated as its start
+KEYFRAME_TOLERANCE = 0.001
+
+# format audio is decoded to when streaming clips to the encoder
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+
+# bytes of audio to copy between processes at a time
+CHUNK_SIZE = 1024 * 1024
+
+# names ffmpeg reports for h264 profiles, and the names libx264 accepts
+PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def copy_format(files: List[str], outputfile: str) -> Optional[dict]:
+    """
+    Checks if clips from a set of files can be joined without re-encoding.
+    Every file needs an H.264 video stream with the same size, pixel format,
+    frame rate and profile, and either no audio or AAC audio with the same
+    sample rate and channels.
+
+    :param files List[str]: Video file paths
+    :param outputfile str: Path the supercut will be saved to
+    :rtype Optional[dict]: The shared {video, audio} format, or None if the files aren't compatible
+    """
+    if os.path.splitext(outputfile)[1].lower() not in COPY_FORMATS:
+        return None
+
+    formats = []
+    for f in files:
+        info = probe(f)
+        if info is None or info["video"] is None:
+            return None
+        if info["video"]["codec"] != "h264":
+            return None
+        if not info["video"]["fps"]:
+            return None
+        if info["audio"] is not None and info["audio"]["codec"] != "aac":
+            return None
+        formats.append({"video": info["video"], "audio": info["audio"]})
+
+    if any(f != formats[0] for f in formats[1:]):
+        return None
+
+    return formats[0]
+
+
+def join_format(files: List[str], outputfile: str) -> bool:
+    """
+    Checks if whole files can be joined without re-encoding. Their video
+    and audio need the same codec and parameters. Unlike splicing pieces of
+    clips, joining whole files works whether or not they have B-frames.
+
+    :param files List[str]: Video file paths
+    :param outputfile str: Path the joined file will be saved to
+    :rtype bool: True if the files can be joined
+    """
+    if os.path.splitext(outputfile)[1].lower() not in COPY_FORMATS:
+        return False
+
+    formats = []
+    for f in files:
+        info = probe(f)
+        if info is None or info["video"] is None:
+            return False
+        video = info["video"]
+        audio = info["audio"]
+        formats.append(
+            (
+                (video["codec"], video["width"], video["height"]),
+                (video["pix_fmt"], video["fps"]),
+                audio and (audio["codec"], audio["sample_rate"], audio["channels"]),
+            )
+        )
+
+    return all(f == formats[0] for f in formats[1:])
+
+
+def plan_cuts(
+    start: float, end: float, keys: List[float]
+) -> List[Tuple[float, float, bool]]:
+    """
+    Splits a clip at its first keyframe. Everything from that keyframe on
+    can be copied as is, and only the frames before it need re-encoding.
+
+    :param start float: Clip start in seconds
+    :param end float: Clip end in seconds
+    :param keys List[float]: Keyframe times of the video, in order
+    :rtype List[Tuple[float, float, bool]]: List of (start, end, re-encode)
+    """
+    i = bisect_left(keys, start - KEYFRAME_TOLERANCE)
+    if i == len(keys) or keys[i] >= end - KEYFRAME_TOLERANCE:
+        return [(start, end, True)]
+
+    keyframe = keys[i]
+    if keyframe <= start + KEYFRAME_TOLERANCE:
+        return [(keyframe, end, False)]
+
+    return [(start, keyframe, True), (keyframe, end, False)]
+
+
+def snap_cuts(
+    start: float, end: float, keys: List[float], duration: Optional[float] = None
+) -> List[Tuple[float, float, bool]]:
+    """
+    Widens a clip to whole groups of pictures, from the keyframe at or
+    before its start to the keyframe at or after its end. Videos with
+    B-frames store frames out of order, so a re-encoded start can't be
+    spliced onto them, but whole groups can be copied as they are.
+
+    :param start float: Clip start in seconds
+    :param end float: Clip end in seconds
+    :param keys List[float]: Keyframe times of the video, in order
+    :param duration Optional[float]: Length of the video, where the last group ends
+    :rtype List[Tuple[float, float, bool]]: List of (start, end, re-encode)
+    """
+    i = bisect_left(keys, start + KEYFRAME_TOLERANCE)
+    keyframe = keys[max(i - 1, 0)]
+
+    j = bisect_left(keys, end - KEYFRAME_TOLERANCE)
+    if j < len(keys):
+        end = keys[j]
+    elif duration is not None:
+        end = duration
+
+    return [(keyframe, max(end, keyframe), False)]
+
+
+def create_supercut_copy(composition: List[dict], outputfile: str) -> bool:
+    """
+    Concatenates clips with ffmpeg, copying the video and audio streams
+    rather than decoding and re-encoding every frame. Only the frames
+    between the start of a clip and its first keyframe are re-encoded, or,
+    if the inputs have B-frames, clips are widened to whole keyframe
+    intervals. The pieces are joined with ffmpeg's concat demuxer.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the video to
+    :rtype bool: False if the inputs can't be stream copied, or ffmpeg failed
+    """
+
+    shared, keys = copy_plan(composition, outputfile)
+    if shared is None:
+        print("[+] Inputs can't be joined without re-encoding.")
+        return False
+
+    tempdir = tempfile.mkdtemp(
+        prefix=".videogrep", dir=os.path.dirname(os.path.abspath(outputfile))
+    )
+
+    try:
+        print("[+] Cutting clips.")
+        pieces = []
+        for c in composition:
+            cut = cut_clip(c, shared, keys[c["file"]], tempdir, len(pieces))
+            if cut is None:
+                return False
+            pieces += cut
+
+        print("[+] Joining clips.")
+        return run_ffmpeg(
+            join_command(pieces, outputfile, tempdir, shared["video"]["fps"])
+        )
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def export_clips_copy(composition: List[dict], outputfile: str, jobs: int = 1) -> bool:
+    """
+    Exports each clip to its own file, copying the video and audio streams
+    like create_supercut_copy(). Clips are cut by up to jobs ffmpeg
+    processes at a time.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the clips to. Clips are numbered after it
+    :param jobs int: Number of clips to cut at the same time
+    :rtype bool: False if the inputs can't be stream copied
+    """
+
+    shared, keys = copy_plan(composition, outputfile)
+    if shared is None:
+        print("[+] Inputs can't be cut without re-encoding.")
+        return False
+
+    basename, ext = os.path.splitext(outputfile)
+    clips = []
+    for i, c in enumerate(composition):
+        clips.append((c, basename + "_" + str(i).zfill(5) + ext))
+
+    def export(clip: Tuple[dict, str]) -> bool:
+        c, clipfilename = clip
+        tempdir = tempfile.mkdtemp(
+            prefix=".videogrep", dir=os.path.dirname(os.path.abspath(clipfilename))
+        )
+        try:
+            pieces = cut_clip(c, shared, keys[c["file"]], tempdir)
+            return pieces is not None and run_ffmpeg(
+                join_command(pieces, clipfilename, tempdir, shared["video"]["fps"])
+            )
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+    print("[+] Writing output files.")
+    # ffmpeg does the work, so threads are enough to keep several clips going
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        results = list(pool.map(export, clips))
+
+    failed = results.count(False)
+    if failed > 0:
+        print(f"[!] {failed} of {len(clips)} clips couldn't be exported.")
+    return True
+
+
+def copy_plan(composition: List[dict], outputfile: str) -> Tuple[Optional[dict], dict]:
+    """
+    Checks if clips can be cut without re-encoding, and finds the keyframes
+    of their files
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path the clips will be saved to
+    :rtype Tuple[Optional[dict], dict]: The shared format from copy_format(), or None, and the keyframes of each file
+    """
+    all_filenames = sorted(set([c["file"] for c in composition]))
+
+    shared = copy_format(all_filenames, outputfile)
+    keys = {}
+    if shared is not None:
+        keys = dict([(f, keyframes(f)) for f in all_filenames])
+
+    if shared is None or any(k is None or len(k) == 0 for k in keys.values()):
+        return None, {}
+
+    return shared, keys
+
+
+def cut_clip(
+    c: dict, shared: dict, keys: List[float], tempdir: str, first: int = 0
+) -> Optional[List[Tuple[str, float]]]:
+    """
+    Cuts a clip into pieces that can be joined without re-encoding
+
+    :param c dict: The clip, as {start, end, file}
+    :param shared dict: Format of the inputs, from copy_format()
+    :param keys List[float]: Keyframe times of the clip's file
+    :param tempdir str: Folder to save the pieces to
+    :param first int: Number of the first piece, to keep piece names unique
+    :rtype Optional[List[Tuple[str, float]]]: (path, duration) of each piece, or None if ffmpeg failed
+    """
+    start = max(c["start"], 0)
+    end = c["end"]
+    duration = probe(c["file"])["duration"]
+    if duration is not None and end > duration:
+        end = duration
+
+    # cut on whole frames, so that each piece is exactly as long as intended
+    fps = shared["video"]["fps"]
+    if fps:
+        start = round(start * fps) / fps
+        end = max(round(end * fps) / fps, start + 1 / fps)
+
+    frames = None
+    if shared["video"]["b_frames"]:
+        cuts = snap_cuts(start, end, keys, duration)
+    else:
+        cuts = plan_cuts(start, end, keys)
+
+    pieces = []
+    for cut_start, cut_end, encode in cuts:
+        if shared["video"]["b_frames"] and fps:
+            frames = round((cut_end - cut_start) * fps)
+        piece = os.path.join(tempdir, f"{first + len(pieces):05d}.mkv")
+        command = cut_command(
+            c["file"], cut_start, cut_end, piece, shared if encode else None, frames
+        )
+        if not run_ffmpeg(command):
+            return None
+        pieces.append((piece, cut_end - cut_start))
+
+    return pieces
+
+
+def create_supercut_stream(
+    composition: List[dict], outputfile: str, video: bool = True
+) -> bool:
+    """
+    Renders a supercut with a single ffmpeg encoder. Each clip is decoded by
+    its own short-lived ffmpeg process, and the raw frames and samples are
+    piped to the encoder in order, so memory use stays the same however many
+    clips there are. The audio is decoded first, to a temporary file, and is
+    then encoded along with the video.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the supercut to
+    :param video bool: Render video with audio, rather than only audio
+    :rtype bool: False if an input can't be read, or ffmpeg failed
+    """
+
+    all_filenames = sorted(set([c["file"] for c in composition]))
+    infos = dict([(f, probe(f)) for f in all_filenames])
+    unreadable = [f for f, info in infos.items() if info is None]
+    if video:
+        unreadable += [f for f, info in infos.items() if info and not info["video"]]
+    if len(unreadable) > 0:
+        print(f"[!] Can't read {unreadable[0]}")
+        return False
+
+    clips = []
+    for c in composition:
+        start = max(c["start"], 0)
+        end = c["end"]
+        duration = infos[c["file"]]["duration"]
+        if duration is not None and end > duration:
+            end = duration
+        clips.append((c["file"], start, max(end, start)))
+
+    tempdir = tempfile.mkdtemp(
+        prefix=".videogrep", dir=os.path.dirname(os.path.abspath(outputfile))
+    )
+
+    try:
+        if not video:
+            samples = stream_lengths(clips, SAMPLE_RATE)
+            command = encode_command(outputfile)
+            return stream(command, clips, samples, tempdir, audio=True)
+
+        width = max(infos[f]["video"]["width"] for f in all_filenames)
+        height = max(infos[f]["video"]["height"] for f in all_filenames)
+        fps = max(infos[f]["video"]["fps"] or 0 for f in all_filenames) or 25
+        frames = stream_lengths(clips, fps)
+
+        # cut the audio to the frames each clip actually gets, to keep it in sync
+        samples = stream_lengths(
+            [(f, 0, n / fps) for (f, start, end), n in zip(clips, frames)],
+            SAMPLE_RATE,
+        )
+
+        audiofile = None
+        if any(infos[f]["audio"] is not None for f in all_filenames):
+            print("[+] Decoding audio.")
+            audiofile = os.path.join(tempdir, "audio.pcm")
+            with open(audiofile, "wb") as outfile:
+                for (filename, start, end), count in zip(clips, samples):
+                    decoder = decode_audio_command(filename, start, end)
+                    pipe(decoder, outfile, count * CHANNELS * SAMPLE_WIDTH)
+
+        print("[+] Encoding video.")
+        command = encode_command(outputfile, (width, height, fps), audiofile)
+        return stream(command, clips, frames, tempdir, size=(width, height, fps))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def stream_lengths(clips: List[Tuple[str, float, float]], rate: float) -> List[int]:
+    """
+    Works out how many frames or samples each clip gets. Positions are
+    rounded on the whole timeline rather than clip by clip, so that the
+    rounding doesn't add up.
+
+    :param clips List[Tuple[str, float, float]]: List of (file, start, end)
+    :param rate float: Frames or samples per second
+    :rtype List[int]: Number of frames or samples for each clip
+    """
+    counts = []
+    elapsed = 0
+    position = 0
+    for filename, start, end in clips:
+        elapsed += end - start
+        counts.append(round(elapsed * rate) - position)
+        position += counts[-1]
+    return counts
+
+
+def stream(
+    command: List[str],
+    clips: List[Tuple[str, float, float]],
+    counts: List[int],
+    tempdir: str,
+    size: Optional[Tuple[int, int, float]] = None,
+    audio: bool = False,
+) -> bool:
+    """
+    Runs an encoder and pipes it the decoded clips
+
+    :param command List[str]: Encoder arguments, reading from stdin
+    :param clips List[Tuple[str, float, float]]: List of (file, start, end)
+    :param counts List[int]: Number of frames or samples for each clip
+    :param tempdir str: Folder to write the encoder's log to
+    :param size Optional[Tuple[int, int, float]]: Width, height and frame rate of the video
+    :param audio bool: Pipe audio samples rather than video frames
+    :rtype bool: True if ffmpeg succeeded
+    """
+    logfile = os.path.join(tempdir, "encoder.log")
+    with open(logfile, "wb") as log:
+        encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=log)
+        try:
+            for (filename, start, end), count in zip(clips, counts):
+                if audio:
+                    decoder = decode_audio_command(filename, start, end)
+                    pipe(decoder, encoder.stdin, count * CHANNELS * SAMPLE_WIDTH)
+                else:
+                    decoder = decode_video_command(filename, start, end, size, count)
+                    pipe(
+                        decoder,
+                        encoder.stdin,
+                        count * frame_size(size),
+                        frame_size(size),
+                    )
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        encoder.wait()
+
+    if encoder.returncode != 0:
+        with open(logfile, "rb") as log:
+            print(log.read().decode("utf8", errors="replace").strip())
+        return False
+    return True
+
+
+def pipe(command: List[str], outfile, length: int, frame: int = CHUNK_SIZE):
+    """
+    Copies a set number of bytes from the output of a decoder. If the
+    decoder stops early, the rest is filled by repeating its last frame, or
+    with zeros if it had no output at all.
+
+    :param command List[str]: Decoder arguments, writing to stdout
+    :param outfile: File or pipe to copy to
+    :param length int: Number of bytes to copy
+    :param frame int: Bytes in a frame of video, or in a chunk of audio
+    """
+    decoder = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    last = b""
+    copied = 0
+    try:
+        while copied < length:
+            data = decoder.stdout.read(min(frame, length - copied))
+            if len(data) == 0:
+                break
+            outfile.write(data)
+            copied += len(data)
+            if len(data) == frame:
+                last = data
+    finally:
+        decoder.stdout.close()
+        decoder.kill()
+        decoder.wait()
+
+    if len(last) == 0:
+        last = b"\x00" * frame
+    while copied < length:
+        data = last[: length - copied]
+        outfile.write(data)
+        copied += len(data)
+
+
+def frame_size(size: Tuple[int, int, float]) -> int:
+    """Number of bytes in a raw yuv420p frame"""
+    width, height, fps = size
+    return width * height + 2 * ((width + 1) // 2) * ((height + 1) // 2)
+
+
+def decode_video_command(
+    filename: str,
+    start: float,
+    end: float,
+    size: Tuple[int, int, float],
+    frames: int,
+) -> List[str]:
+    """
+    Builds an ffmpeg command that decodes part of a video to raw frames,
+    centered on a frame of the given size like moviepy's compose method
+
+    :param filename str: Video file path
+    :param start float: Start in seconds
+    :param end float: End in seconds
+    :param size Tuple[int, int, float]: Width, height and frame rate to output
+    :param frames int: Number of frames to output
+    :rtype List[str]: ffmpeg arguments
+    """
+    width, height, fps = size
+    return [
+        ffmpeg_binary(),
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        str(start),
+        "-i",
+        filename,
+        "-t",
+        str(end - start),
+        "-map",
+        "0:v:0",
+        "-vf",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "-r",
+        str(fps),
+        "-frames:v",
+        str(frames),
+        "-pix_fmt",
+        "yuv420p",
+        "-f",
+        "rawvideo",
+        "-",
+    ]
+
+
+def decode_audio_command(filename: str, start: float, end: float) -> List[str]:
+    """
+    Builds an ffmpeg command that decodes part of a file to raw audio samples
+
+    :param filename str: Media file path
+    :param start float: Start in seconds
+    :param end float: End in seconds
+    :rtype List[str]: ffmpeg arguments
+    """
+    return [
+        ffmpeg_binary(),
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        str(start),
+        "-i",
+        filename,
+        "-t",
+        str(end - start),
+        "-map",
+        "0:a:0",
+        "-ac",
+        str(CHANNELS),
+        "-ar",
+        str(SAMPLE_RATE),
+        "-f",
+        "s16le",
+        "-",
+    ]
+
+
+def encode_command(
+    outputfile: str,
+    size: Optional[Tuple[int, int, float]] = None,
+    audiofile: Optional[str] = None,
+) -> List[str]:
+    """
+    Builds an ffmpeg command that encodes raw frames from stdin, or raw
+    audio from stdin if size is None
+
+    :param outputfile str: Path to save to
+    :param size Optional[Tuple[int, int, float]]: Width, height and frame rate of the video
+    :param audiofile Optional[str]: Raw audio file to add to the video
+    :rtype List[str]: ffmpeg arguments
+    """
+    command = [ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error"]
+    raw_audio = [
+        "-f",
+        "s16le",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-ac",
+        str(CHANNELS),
+        "-i",
+    ]
+
+    if size is None:
+        return command + raw_audio + ["-", outputfile]
+
+    width, height, fps = size
+    command += [
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "yuv420p",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+    ]
+    if audiofile is not None:
+        command += raw_audio + [audiofile, "-map", "0:v", "-map", "1:a", "-c:a", "aac"]
+
+    return command + ["-c:v", "libx264", "-pix_fmt", "yuv420p", outputfile]
+
+
+def cut_command(
+    filename: str,
+    start: float,
+    end: float,
+    outputfile: str,
+    encode: Optional[dict] = None,
+    frames: Optional[int] = None,
+) -> List[str]:
+    """
+    Builds an ffmpeg command that cuts part of a file into a Matroska file
+
+    :param filename str: Video file path
+    :param start float: Start in seconds
+    :param end float: End in seconds
+    :param outputfile str: Path to save the part to
+    :param encode Optional[dict]: Format to re-encode to. The streams are copied if None
+    :param frames Optional[int]: Number of video frames to keep. Copying otherwise carries on past the end to the frames that are displayed before it
+    :rtype List[str]: ffmpeg arguments
+    """
+    command = [
+        ffmpeg_binary(),
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        str(start),
+        "-i",
+        filename,
+        "-t",
+        str(end - start),
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+    ]
+
+    if frames is not None:
+        command += ["-frames:v", str(frames)]
+
+    if encode is None:
+        command += ["-c", "copy"]
+    else:
+        video = encode["video"]
+        command += ["-c:v", "libx264", "-bf", "0", "-pix_fmt", video["pix_fmt"]]
+        if video["profile"] in PROFILES:
+            command += ["-profile:v", PROFILES[video["profile"]]]
+
+        audio = encode["audio"]
+        if audio is not None:
+            command += ["-c:a", "aac"]
+            if audio["sample_rate"] is not None:
+                command += ["-ar", str(audio["sample_rate"])]
+            if audio["channels"] is not None:
+                command += ["-ac", str(audio["channels"])]
+
+    return command + ["-f", "matroska", outputfile]
+
+
+def join_files(files: List[str], outputfile: str) -> bool:
+    """
+    Joins files that share the same codecs into one, copying the streams
+    rather than re-encoding them
+
+    :param files List[str]: Files to join, in order
+    :param outputfile str: Path to save the joined file to
+    :rtype bool: True if ffmpeg succeeded
+    """
+    tempdir = tempfile.mkdtemp(
+        prefix=".videogrep", dir=os.path.dirname(os.path.abspath(outputfile))
+    )
+    try:
+        pieces = [(f, None) for f in files]
+        return run_ffmpeg(join_command(pieces, outputfile, tempdir))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+
+def join_command(
+    pieces: List[Tuple[str, Optional[float]]],
+    outputfile: str,
+    tempdir: str,
+    fps: Optional[float] = None,
+) -> List[str]:
+    """
+    Builds an ffmpeg command that joins files with the concat demuxer, without re-encoding
+
+    :param pieces List[Tuple[str, Optional[float]]]: Files to join, in order, with their intended durations, or None to use all of a file
+    :param outputfile str: Path to save the joined file to
+    :param tempdir str: Folder to write the list of files to
+    :param fps Optional[float]: Frame rate to give the video timestamps. Needed when the pieces are cut from different files or encoders, whose timestamps don't line up
+    :rtype List[str]: ffmpeg arguments
+    """
+    listfile = os.path.join(tempdir, "concat.txt")
+    with open(listfile, "w", encoding="utf8") as outfile:
+        for piece, duration in pieces:
+            # paths in the list are relative to the list, not the working directory
+            escaped = os.path.abspath(piece).replace("'", "'\\''")
+            outfile.write(f"file '{escaped}'\n")
+            if duration is None:
+                continue
+            # cuts end on a frame boundary, so drop anything past the intended end
+            # rather than letting small overshoots add up
+            outfile.write(f"outpoint {duration}\n")
+            outfile.write(f"duration {duration}\n")
+
+    command = [
+        ffmpeg_binary(),
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        listfile,
+        "-map",
+        "0",
+        "-c",
+        "copy",
+    ]
+
+    # number the frames on a fixed grid, rather than keeping the timestamps
+    # of each piece, which overlap or leave gaps where pieces meet. Frames
+    # keep their own delay between decoding and display, for B-frames
+    if fps:
+        grid = f"N/({fps}*TB)"
+        command += ["-bsf:v", f"setts=dts={grid}:pts={grid}+PTS-DTS"]
+
+    return command + [outputfile]
+
+
+def run_ffmpeg(command: List[str]) -> bool:
+    """
+    Runs an ffmpeg command, printing its errors if it fails
+
+    :param command List[str]: ffmpeg arguments
+    :rtype bool: True if ffmpeg succeeded
+    """
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(result.stderr.decode("utf8", errors="replace").strip())
+        return False
+    return True
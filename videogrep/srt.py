@@ -1,6 +1,9 @@
 import re
 import io
-from typing import Tuple, Union, List
+from typing import Tuple, Union, List, Iterable, Iterator
+
+# cue numbers are on a line of their own
+INDEX = re.compile(r"\d+[\n\r]")
 
 
 def convert_timespan(timespan: str) -> Tuple[float, float]:
@@ -35,38 +38,50 @@ def convert_timestamp(timestamp: str) -> float:
     return seconds
 
 
-def parse(srt: Union[io.IOBase, str]) -> List[dict]:
+def iter_parse(srt: Union[Iterable[str], str]) -> Iterator[dict]:
     """
-    Converts an srt file into a list of dictionary timestamps
+    Reads an srt file one line at a time, yielding each timestamp as soon
+    as it is complete. Only one cue is held in memory at a time, so it can
+    be used on very large files.
 
-    :param srt Union[io.IOBase, str]: srt content or file reader
-    :rtype List[dict]: List of timestamps and content
+    :param srt Union[Iterable[str], str]: srt content, file reader, or any iterable of lines
+    :rtype Iterator[dict]: Timestamps and content
     """
 
-    _srt: str = ""
+    if isinstance(srt, str):
+        srt = io.StringIO(srt, newline=None)
 
-    if isinstance(srt, io.IOBase):
-        _srt = srt.read()
-    else:
-        _srt = srt
+    item = None
+    content: List[str] = []
 
-    out = []
-
-    _srt = _srt.replace(u"\ufeff", "")
-    _srt = re.sub(r"^\d+[\n\r]", "", _srt, flags=re.MULTILINE)
-    lines = _srt.splitlines()
-
-    for line in lines:
+    for line in srt:
+        line = line.replace("\ufeff", "")
+        if INDEX.match(line):
+            continue
         line = line.strip()
         if line == "":
             continue
         if "-->" in line:
-            if len(out) > 0:
-                out[-1]["content"] = out[-1]["content"].strip()
+            if item is not None:
+                item["content"] = " ".join(content)
+                yield item
             start, end = convert_timespan(line)
             item = {"start": start, "end": end, "content": ""}
-            out.append(item)
-        else:
-            out[-1]["content"] += line + " "
+            content = []
+        elif item is not None:
+            content.append(line)
+
+    if item is not None:
+        item["content"] = " ".join(content)
+        yield item
+
+
+def parse(srt: Union[io.IOBase, str]) -> List[dict]:
+    """
+    Converts an srt file into a list of dictionary timestamps
+
+    :param srt Union[io.IOBase, str]: srt content or file reader
+    :rtype List[dict]: List of timestamps and content
+    """
 
-    return out
+    return list(iter_parse(srt))
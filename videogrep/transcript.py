@@ -0,0 +1,341 @@
+import re
+import math
+from array import array
+from bisect import bisect_right
+from typing import Optional, List, Dict, Iterator, Sequence, Tuple
+
+
+class Transcript:
+    """
+    A compact, column based transcript.
+
+    Instead of a dict per sentence and per word, times are stored in flat
+    arrays and every distinct word is stored once in a vocabulary, with
+    word_ids pointing into it. The words of sentence i are the ones between
+    offsets[i] and offsets[i + 1]. Indexing or iterating over a Transcript
+    gives the same dicts that parse_transcript() used to return.
+
+    :param vocabulary List[str]: Distinct words
+    :param word_ids Sequence[int]: Vocabulary index of each word
+    :param starts Sequence[float]: Start time of each word
+    :param ends Sequence[float]: End time of each word
+    :param confs Optional[Sequence[float]]: Confidence of each word, NaN if unknown
+    :param sentence_starts Sequence[float]: Start time of each sentence, NaN if unknown
+    :param sentence_ends Sequence[float]: End time of each sentence, NaN if unknown
+    :param offsets Sequence[int]: Position of the first word of each sentence, plus the total word count
+    :param contents Sequence[str]: Text of each sentence
+    :param word_level bool: Whether the transcript has word-level timestamps
+    """
+
+    def __init__(
+        self,
+        vocabulary: List[str],
+        word_ids: Sequence[int],
+        starts: Sequence[float],
+        ends: Sequence[float],
+        confs: Optional[Sequence[float]],
+        sentence_starts: Sequence[float],
+        sentence_ends: Sequence[float],
+        offsets: Sequence[int],
+        contents: Sequence[str],
+        word_level: bool,
+    ):
+        self.vocabulary = vocabulary
+        self.word_ids = word_ids
+        self.starts = starts
+        self.ends = ends
+        self.confs = confs
+        self.sentence_starts = sentence_starts
+        self.sentence_ends = sentence_ends
+        self.offsets = offsets
+        self.contents = contents
+        self.word_level = word_level
+        self._occurrences: Optional[Dict[int, array]] = None
+        self._folded: Optional[Dict[str, List[int]]] = None
+        self._buffer: Optional[Tuple[str, array]] = None
+
+    @classmethod
+    def from_dicts(cls, data: List[dict]) -> "Transcript":
+        """
+        Builds a compact transcript from a list of sentence dicts, as returned
+        by the srt, vtt and sphinx parsers or stored in json transcripts.
+
+        :param data List[dict]: List of {content, start, end, words}
+        :rtype Transcript: Compact transcript
+        """
+
+        word_level = len(data) > 0 and "words" in data[0]
+
+        vocabulary: List[str] = []
+        lookup: Dict[str, int] = {}
+        word_ids = array("I")
+        starts = array("d")
+        ends = array("d")
+        confs = array("d")
+        has_confs = False
+        sentence_starts = array("d")
+        sentence_ends = array("d")
+        offsets = array("I", [0])
+        contents = []
+
+        for line in data:
+            sentence_starts.append(_to_float(line["start"]))
+            sentence_ends.append(_to_float(line["end"]))
+            contents.append(line["content"])
+
+            for w in line.get("words", []) if word_level else []:
+                word = w["word"]
+                word_id = lookup.get(word)
+                if word_id is None:
+                    word_id = lookup[word] = len(vocabulary)
+                    vocabulary.append(word)
+                word_ids.append(word_id)
+                starts.append(w["start"])
+                ends.append(w["end"])
+                if "conf" in w:
+                    has_confs = True
+                    confs.append(w["conf"])
+                else:
+                    confs.append(math.nan)
+
+            offsets.append(len(word_ids))
+
+        return cls(
+            vocabulary,
+            word_ids,
+            starts,
+            ends,
+            confs if has_confs else None,
+            sentence_starts,
+            sentence_ends,
+            offsets,
+            contents,
+            word_level,
+        )
+
+    def __getstate__(self) -> dict:
+        # lookup tables are rebuilt on demand, so don't store them
+        state = self.__dict__.copy()
+        state["_occurrences"] = None
+        state["_folded"] = None
+        state["_buffer"] = None
+        return state
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("transcript index out of range")
+
+        sentence = {
+            "content": self.contents[index],
+            "start": self.start(index),
+            "end": self.end(index),
+        }
+        if self.word_level:
+            sentence["words"] = self.words(index)
+        return sentence
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_dicts(self) -> List[dict]:
+        """
+        Converts the transcript back to a list of sentence dicts
+
+        :rtype List[dict]: List of {content, start, end, words}
+        """
+        return list(self)
+
+    def start(self, index: int) -> Optional[float]:
+        """Start time of a sentence"""
+        return _from_float(self.sentence_starts[index])
+
+    def end(self, index: int) -> Optional[float]:
+        """End time of a sentence"""
+        return _from_float(self.sentence_ends[index])
+
+    def word(self, position: int) -> str:
+        """The word at a position in the transcript"""
+        return self.vocabulary[self.word_ids[position]]
+
+    def word_count(self) -> int:
+        """Total number of words in the transcript"""
+        return len(self.word_ids)
+
+    def occurrences(self, word_id: int) -> Sequence[int]:
+        """
+        Positions of every occurrence of a word. The lookup table is built
+        the first time this is called, and reused afterwards.
+
+        :param word_id int: Vocabulary index of the word
+        :rtype Sequence[int]: Word positions, in order
+        """
+        if self._occurrences is None:
+            occurrences: Dict[int, array] = {}
+            for position, i in enumerate(self.word_ids):
+                if i not in occurrences:
+                    occurrences[i] = array("I")
+                occurrences[i].append(position)
+            self._occurrences = occurrences
+        return self._occurrences.get(word_id, ())
+
+    def find_word(self, word: str) -> List[int]:
+        """
+        Positions of every occurrence of a word, ignoring case
+
+        :param word str: Word to look for
+        :rtype List[int]: Word positions
+        """
+        if self._folded is None:
+            folded: Dict[str, List[int]] = {}
+            for i, w in enumerate(self.vocabulary):
+                folded.setdefault(w.lower(), []).append(i)
+            self._folded = folded
+
+        positions: List[int] = []
+        for i in self._folded.get(word.lower(), []):
+            positions += self.occurrences(i)
+        return positions
+
+    def find_fragments(self, queries: List[str]) -> List[int]:
+        """
+        Finds runs of consecutive words where each word matches the
+        corresponding regular expression. Each expression is only tested
+        once against every distinct word, and only the positions of the most
+        selective one are checked against the others.
+
+        :param queries List[str]: One regular expression per word
+        :rtype List[int]: Position of the first word of each match, in order
+        """
+        if len(queries) == 0:
+            return []
+
+        patterns = [re.compile(q) for q in queries]
+        matching = [
+            set(i for i, word in enumerate(self.vocabulary) if pattern.search(word))
+            for pattern in patterns
+        ]
+
+        counts = [sum(len(self.occurrences(i)) for i in m) for m in matching]
+        rarest = counts.index(min(counts))
+        if counts[rarest] == 0:
+            return []
+
+        word_ids = self.word_ids
+        last_start = len(word_ids) - len(queries)
+
+        out = []
+        for word_id in matching[rarest]:
+            for position in self.occurrences(word_id):
+                start = position - rarest
+                if start < 0 or start > last_start:
+                    continue
+                if all(
+                    word_ids[start + j] in m
+                    for j, m in enumerate(matching)
+                    if j != rarest
+                ):
+                    out.append(start)
+
+        return sorted(out)
+
+    def buffer(self) -> Optional[Tuple[str, array]]:
+        """
+        All sentences joined into a single string, one sentence per line,
+        along with the position each sentence starts at in that string (plus
+        the length of the string and its final newline). Built the first
+        time this is called.
+
+        :rtype Optional[Tuple[str, array]]: Text and offsets, or None if a sentence contains a newline
+        """
+        if self._buffer is None:
+            if any("\n" in content for content in self.contents):
+                return None
+            positions = array("I", [0])
+            for content in self.contents:
+                positions.append(positions[-1] + len(content) + 1)
+            self._buffer = ("\n".join(self.contents) + "\n", positions)
+        return self._buffer
+
+    def scan(
+        self, pattern: re.Pattern, cross_sentences: bool = False
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        Searches the whole transcript with one regex pass instead of one
+        search per sentence. Each match is mapped back to its sentence by
+        bisecting the sentence offsets of the buffer.
+
+        The pattern should be compiled with re.MULTILINE, so that ^ and $
+        match at the start and end of each sentence. Matches that run past
+        the end of their sentence are only kept when cross_sentences is set.
+        Otherwise the sentence is searched by itself instead.
+
+        :param pattern re.Pattern: Compiled regular expression
+        :param cross_sentences bool: Allow matches that span several sentences
+        :rtype Optional[List[Tuple[int, int]]]: (first, last) sentence of each match, or None if the transcript can't be scanned
+        """
+        buffer = self.buffer()
+        if buffer is None:
+            return None
+
+        text, positions = buffer
+        last = len(self.contents)
+
+        out = []
+        position = 0
+        while position < len(text):
+            match = pattern.search(text, position)
+            if match is None:
+                break
+
+            first = bisect_right(positions, match.start()) - 1
+            if first >= last:
+                break
+
+            # each sentence is followed by a newline, matches that reach it
+            # are crossing into the next sentence
+            if match.end() < positions[first + 1]:
+                out.append((first, first))
+            elif cross_sentences:
+                end = bisect_right(positions, match.end() - 1) - 1
+                out.append((first, min(end, last - 1)))
+            elif pattern.search(self.contents[first]):
+                out.append((first, first))
+
+            position = positions[first + 1]
+            if cross_sentences:
+                position = max(position, match.end())
+
+        return out
+
+    def words(self, index: int) -> List[dict]:
+        """
+        Returns the words of a sentence as dicts
+
+        :param index int: Sentence index
+        :rtype List[dict]: List of {word, start, end}
+        """
+        out = []
+        for position in range(self.offsets[index], self.offsets[index + 1]):
+            w = {
+                "word": self.word(position),
+                "start": self.starts[position],
+                "end": self.ends[position],
+            }
+            if self.confs is not None and not math.isnan(self.confs[position]):
+                w["conf"] = self.confs[position]
+            out.append(w)
+        return out
+
+
+def _to_float(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _from_float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
@@ -0,0 +1,174 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections.abc import Sequence
+from typing import List, Union
+
+from .transcript import Transcript
+
+MAGIC = b"VGT\x00"
+VERSION = 1
+WORD_LEVEL = 1
+HAS_CONFS = 2
+
+# magic, version, flags, sentence count, word count, vocabulary size
+HEADER = struct.Struct("<4sIIIII")
+
+
+class StringTable(Sequence):
+    """
+    A read-only list of strings stored as utf-8 in a buffer, with the
+    position of each string in a parallel offsets array. Strings are only
+    decoded when accessed.
+
+    :param offsets Sequence[int]: Start of each string, plus the end of the last one
+    :param data memoryview: Encoded strings
+    """
+
+    def __init__(self, offsets, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("string table index out of range")
+        start = self.offsets[index]
+        end = self.offsets[index + 1]
+        return str(self.data[start:end], "utf-8")
+
+
+def load(filename: str) -> Transcript:
+    """
+    Opens a .vgt transcript. The file is memory-mapped rather than read, so
+    only the parts a search touches are loaded from disk, and processes that
+    open the same file share its memory.
+
+    :param filename str: Path to a .vgt file
+    :rtype Transcript: Transcript backed by the file
+    """
+
+    with open(filename, "rb") as infile:
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, flags, sentences, words, vocabulary = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{filename} is not a videogrep transcript")
+
+    view = memoryview(data)
+    position = HEADER.size
+
+    def read(typecode: str, count: int):
+        nonlocal position
+        position = _align(position)
+        size = array(typecode).itemsize * count
+        out = view[position : position + size].cast(typecode)
+        position += size
+        if sys.byteorder != "little":
+            out = array(typecode, out)
+            out.byteswap()
+        return out
+
+    def read_strings(count: int) -> StringTable:
+        nonlocal position
+        offsets = read("Q", count + 1)
+        out = StringTable(offsets, view[position : position + offsets[-1]])
+        position += offsets[-1]
+        return out
+
+    sentence_starts = read("d", sentences)
+    sentence_ends = read("d", sentences)
+    offsets = read("I", sentences + 1)
+    word_ids = read("I", words)
+    starts = read("d", words)
+    ends = read("d", words)
+    confs = read("d", words) if flags & HAS_CONFS else None
+
+    return Transcript(
+        read_strings(vocabulary),
+        word_ids,
+        starts,
+        ends,
+        confs,
+        sentence_starts,
+        sentence_ends,
+        offsets,
+        read_strings(sentences),
+        bool(flags & WORD_LEVEL),
+    )
+
+
+def write(transcript: Transcript, filename: str):
+    """
+    Saves a transcript in the .vgt format: a string table for the words and
+    one for the sentences, plus fixed-width arrays of times and offsets
+
+    :param transcript Transcript: Transcript to save
+    :param filename str: Path to the .vgt file
+    """
+
+    flags = 0
+    if transcript.word_level:
+        flags |= WORD_LEVEL
+    if transcript.confs is not None:
+        flags |= HAS_CONFS
+
+    # write to a temporary file first, since the old file may be mapped by a reader
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as outfile:
+        outfile.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                flags,
+                len(transcript),
+                transcript.word_count(),
+                len(transcript.vocabulary),
+            )
+        )
+
+        def write_array(typecode: str, values):
+            _pad(outfile)
+            values = array(typecode, values)
+            if sys.byteorder != "little":
+                values.byteswap()
+            values.tofile(outfile)
+
+        def write_strings(strings):
+            encoded = [s.encode("utf-8") for s in strings]
+            offsets = [0]
+            for e in encoded:
+                offsets.append(offsets[-1] + len(e))
+            write_array("Q", offsets)
+            outfile.write(b"".join(encoded))
+
+        write_array("d", transcript.sentence_starts)
+        write_array("d", transcript.sentence_ends)
+        write_array("I", transcript.offsets)
+        write_array("I", transcript.word_ids)
+        write_array("d", transcript.starts)
+        write_array("d", transcript.ends)
+        if transcript.confs is not None:
+            write_array("d", transcript.confs)
+        write_strings(transcript.vocabulary)
+        write_strings(transcript.contents)
+
+    os.replace(tmpname, filename)
+
+
+def _align(position: int) -> int:
+    """Rounds up to a multiple of 8, so that arrays in the mapped file are aligned"""
+    return (position + 7) & ~7
+
+
+def _pad(outfile):
+    position = outfile.tell()
+    outfile.write(b"\x00" * (_align(position) - position))
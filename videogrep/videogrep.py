@@ -1,5 +1,6 @@
 import json
 import random
+import hashlib
 import os
 import re
 import gc
@@ -7,9 +8,21 @@ import time
 import mimetypes
 import subprocess
 import sys
-from . import vtt, srt, sphinx, fcpxml
+from . import vtt, srt, sphinx, fcpxml, cache, vgt, render, clipcache, pcm
+from .clipcache import CLIP_CACHE_SIZE
+from .index import Index
+from .matcher import compile_queries, scan_pattern
+from .transcript import Transcript
+from .probe import probe, set_cache_dir
+from .readers import ReaderPool, group_by_source, READER_POOL_SIZE
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import closing
+from functools import lru_cache, partial
+from itertools import groupby, islice
 from pathlib import Path
-from typing import Optional, List, Union, Iterator
+from typing import Optional, List, Union, Iterator, Dict, Tuple, Callable
 
 from moviepy.editor import (
     VideoFileClip,
@@ -18,8 +31,18 @@ from moviepy.editor import (
     concatenate_audioclips,
 )
 
-BATCH_SIZE = 20
-SUB_EXTS = [".json", ".vtt", ".srt", ".transcript"]
+# most clips in one batch, since moviepy checks every clip of a batch for each frame
+BATCH_SIZE = 100
+# megabytes of memory to render batches with, shared between jobs
+BATCH_MEMORY = 1024
+# most seconds of video in one batch, so that a failed batch doesn't lose too much work
+BATCH_DURATION = 300
+# decoded frames moviepy holds at once for each open file
+READER_FRAMES = 4
+# bytes used by each open file besides its frames: the ffmpeg processes and the audio buffer
+READER_OVERHEAD = 48 * 1024 * 1024
+SUB_EXTS = [".vgt", ".json", ".vtt", ".srt", ".transcript"]
+TRANSCRIPT_CACHE_SIZE = 256
 
 
 def find_transcript(videoname: str, prefer: Optional[str] = None) -> Optional[str]:
@@ -31,50 +54,151 @@ def find_transcript(videoname: str, prefer: Optional[str] = None) -> Optional[st
     :rtype Optional[str]: Subtitle file path
     """
 
-    subfile = None
-
     _sub_exts = SUB_EXTS
 
     if prefer is not None:
         _sub_exts = [prefer] + SUB_EXTS
 
-    all_files = [str(f) for f in Path(videoname).parent.iterdir() if f.is_file()]
+    parent = Path(videoname).parent
+    stem = os.path.splitext(os.path.basename(videoname))[0]
+    candidates = scan_directory(str(parent)).get(stem, [])
 
+    # a subtitle file matches if it starts with the video's name, followed by
+    # a dot and then the extension somewhere after it
     for ext in _sub_exts:
-        pattern = (
-            re.escape(os.path.splitext(videoname)[0])
-            + r"\..*?\.?"
-            + ext.replace(".", "")
-        )
-        for f in all_files:
-            if re.search(pattern, f):
-                subfile = f
-                break
-        if subfile:
-            break
+        ext = ext.replace(".", "")
+        for name in candidates:
+            if ext in name[len(stem) + 1 :]:
+                return str(parent / name)
+
+    return None
 
-    return subfile
+
+_directory_cache: Dict[str, Tuple[int, Dict[str, List[str]]]] = {}
+
+
+def scan_directory(dirname: str) -> Dict[str, List[str]]:
+    """
+    Lists the files in a folder, grouped by every name they could be the
+    subtitle file of. For example "video.mp4.en.vtt" is listed under "video",
+    "video.mp4" and "video.mp4.en". Listings are reused until the folder changes.
+
+    :param dirname str: Folder path
+    :rtype Dict[str, List[str]]: Map of video names (without extension) to file names
+    """
+
+    mtime = os.stat(dirname).st_mtime_ns
+    cached = _directory_cache.get(dirname)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    stems: Dict[str, List[str]] = {}
+    for entry in os.scandir(dirname):
+        if not entry.is_file():
+            continue
+        name = entry.name
+        dot = name.find(".")
+        while dot != -1:
+            stems.setdefault(name[:dot], []).append(name)
+            dot = name.find(".", dot + 1)
+
+    # don't trust the listing if the folder was modified very recently, since
+    # some file systems only store modification times to the second
+    if time.time_ns() - mtime > 2_000_000_000:
+        _directory_cache[dirname] = (mtime, stems)
+
+    return stems
 
 
 def parse_transcript(
-    videoname: str, prefer: Optional[str] = None
+    videoname: str, prefer: Optional[str] = None, cache_dir: Optional[str] = None
 ) -> Optional[List[dict]]:
     """
     Helper function to parse a subtitle file and returns timestamps.
 
     :param videoname str: Video file path
     :param prefer Optiona[str]: Transcript file type preference. Can be vtt, srt, or json
+    :param cache_dir Optional[str]: Folder to cache parsed transcripts in
     :rtype Optional[List[dict]]: List of timestamps or None
     """
 
+    transcript = _parse_transcript(videoname, prefer, cache_dir)
+
+    if transcript is None:
+        return None
+
+    return transcript.to_dicts()
+
+
+def _parse_transcript(
+    videoname: str, prefer: Optional[str] = None, cache_dir: Optional[str] = None
+) -> Optional[Transcript]:
     subfile = find_transcript(videoname, prefer)
 
     if subfile is None:
         print("No subtitle file found for ", videoname)
         return None
 
+    return load_transcript(subfile, cache_dir)
+
+
+def load_transcript(
+    subfile: str, cache_dir: Optional[str] = None
+) -> Optional[Transcript]:
+    """
+    Parses a subtitle file into a compact Transcript, reusing earlier results
+    if the file hasn't changed. Parsed transcripts are kept in memory, and
+    optionally saved in cache_dir so that they can be reused across runs. The
+    returned transcript is shared and must not be modified.
+
+    :param subfile str: Subtitle file path
+    :param cache_dir Optional[str]: Folder to cache parsed transcripts in
+    :rtype Optional[Transcript]: Compact transcript or None
+    """
+
+    return _load_transcript(
+        os.path.abspath(subfile), cache.file_stamp(subfile), cache_dir
+    )
+
+
+@lru_cache(maxsize=TRANSCRIPT_CACHE_SIZE)
+def _load_transcript(
+    subfile: str, stamp: tuple, cache_dir: Optional[str]
+) -> Optional[Transcript]:
+    # already compact, and mapped rather than read
+    if subfile.endswith(".vgt"):
+        return vgt.load(subfile)
+
+    if cache_dir is not None:
+        transcript = cache.load(cache_dir, "transcripts", subfile, stamp)
+        if transcript is not None:
+            return transcript
+
+    data = parse_subfile(subfile)
+    if data is None:
+        return None
+
+    transcript = Transcript.from_dicts(data)
+
+    if cache_dir is not None:
+        cache.save(cache_dir, "transcripts", subfile, stamp, transcript)
+
+    return transcript
+
+
+def parse_subfile(subfile: str) -> Optional[List[dict]]:
+    """
+    Parses a subtitle file based on its extension.
+
+    :param subfile str: Subtitle file path
+    :rtype Optional[List[dict]]: List of timestamps or None
+    """
+
     transcript = None
 
+    if subfile.endswith(".vgt"):
+        return vgt.load(subfile).to_dicts()
+
     with open(subfile, "r", encoding="utf8") as infile:
         if subfile.endswith(".srt"):
             transcript = srt.parse(infile)
@@ -88,13 +212,36 @@ def parse_transcript(
     return transcript
 
 
-def get_ngrams(files: Union[str, list], n: int = 1) -> Iterator[tuple]:
+def convert_to_vgt(subfile: str, outputfile: Optional[str] = None) -> Optional[str]:
+    """
+    Converts a subtitle file of any supported type to the compact .vgt format
+
+    :param subfile str: Subtitle file path
+    :param outputfile Optional[str]: Where to save the .vgt file. Defaults to the subtitle file path with a .vgt extension
+    :rtype Optional[str]: Path of the .vgt file, or None if the subtitle file couldn't be parsed
+    """
+
+    if outputfile is None:
+        outputfile = os.path.splitext(subfile)[0] + ".vgt"
+
+    data = parse_subfile(subfile)
+    if data is None:
+        return None
+
+    vgt.write(Transcript.from_dicts(data), outputfile)
+    return outputfile
+
+
+def get_ngrams(
+    files: Union[str, list], n: int = 1, cache_dir: Optional[str] = None
+) -> Iterator[tuple]:
     """
     Get n-grams from video file(s)
     Sourced from: https://gist.github.com/dannguyen/93c2c43f4e65328b85af
 
     :param files Union[str, list]: Path or paths to video files
     :param n int: N-gram size
+    :param cache_dir Optional[str]: Folder to cache parsed transcripts in
     :rtype Iterator[tuple]: List of (n-gram, occurrences)
     """
 
@@ -104,14 +251,14 @@ def get_ngrams(files: Union[str, list], n: int = 1) -> Iterator[tuple]:
     words = []
 
     for file in files:
-        transcript = parse_transcript(file)
+        transcript = _parse_transcript(file, cache_dir=cache_dir)
         if transcript is None:
             continue
-        for line in transcript:
-            if "words" in line:
-                words += [w["word"] for w in line["words"]]
-            else:
-                words += re.split(r"[.?!,:\"]+\s*|\s+", line["content"])
+        if transcript.word_level:
+            words += [transcript.vocabulary[i] for i in transcript.word_ids]
+        else:
+            for content in transcript.contents:
+                words += re.split(r"[.?!,:\"]+\s*|\s+", content)
 
     ngrams = zip(*[words[i:] for i in range(n)])
     return ngrams
@@ -193,104 +340,524 @@ def search(
     query: Union[str, list],
     search_type: str = "sentence",
     prefer: Optional[str] = None,
+    index: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    jobs: int = 1,
+    stats: Optional[dict] = None,
+    engine: str = "line",
+    cross_sentences: bool = False,
 ) -> List[dict]:
     """
-    Searches for a query in a video file or files and returns a list of timestamps in the format [{file, start, end, content}]
+    Searches for a query in a video file or files and returns a list of timestamps in the format [{file, start, end, content, query}]
 
     :param files Union[str, list]: List of files or file
     :param query str: Query as a regular expression, or a list of queries
     :param search_type str: Return timestamps for "sentence" or "fragment"
     :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param index str: Path to a persistent word index to search with (created if missing)
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :param jobs int: Number of processes to search files with
+    :param stats dict: Optional dict that sentence search adds the number of "candidates" checked and "pruned" by the literal prefilter to
+    :param engine str: Sentence search engine. "line" searches each sentence, "buffer" scans each transcript as a whole
+    :param cross_sentences bool: With the "buffer" engine, also return matches spanning several sentences
     :rtype List[dict]: A list of timestamps that match the query
     """
+
+    return list(
+        iter_search(
+            files,
+            query,
+            search_type,
+            prefer,
+            index,
+            cache_dir,
+            jobs,
+            stats,
+            engine,
+            cross_sentences,
+        )
+    )
+
+
+def iter_search(
+    files: Union[str, list],
+    query: Union[str, list],
+    search_type: str = "sentence",
+    prefer: Optional[str] = None,
+    index: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    jobs: int = 1,
+    stats: Optional[dict] = None,
+    engine: str = "line",
+    cross_sentences: bool = False,
+) -> Iterator[dict]:
+    """
+    Searches for a query in a video file or files, yielding timestamps in the
+    format {file, start, end, content} one file at a time. Files are only
+    searched as results are consumed, so callers can stop early.
+
+    :param files Union[str, list]: List of files or file
+    :param query str: Query as a regular expression, or a list of queries
+    :param search_type str: Return timestamps for "sentence", "fragment" or "mash"
+    :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param index str: Path to a persistent word index to search with (created if missing)
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :param jobs int: Number of processes to search files with
+    :param stats dict: Optional dict that sentence search adds the number of "candidates" checked and "pruned" by the literal prefilter to
+    :param engine str: Sentence search engine. "line" searches each sentence, "buffer" scans each transcript as a whole
+    :param cross_sentences bool: With the "buffer" engine, also return matches spanning several sentences
+    :rtype Iterator[dict]: Timestamps that match the query
+    """
     if not isinstance(files, list):
         files = [files]
 
     if not isinstance(query, list):
         query = [query]
 
-    all_segments = []
+    # mashes pick words from all files at once
+    if search_type == "mash":
+        yield from mash(files, query, prefer, index, cache_dir)
+        return
+
+    for segments in _search_files(
+        files,
+        query,
+        search_type,
+        prefer,
+        index,
+        cache_dir,
+        jobs,
+        stats,
+        engine,
+        cross_sentences,
+    ):
+        yield from segments
+
+
+def _search_files(
+    files: List[str],
+    query: List[str],
+    search_type: str,
+    prefer: Optional[str],
+    index: Optional[str],
+    cache_dir: Optional[str],
+    jobs: int,
+    stats: Optional[dict],
+    engine: str,
+    cross_sentences: bool,
+) -> Iterator[List[dict]]:
+    """Yields the results of search_file() or search_index() for each file, in order"""
+
+    if index is not None:
+        with Index(index) as idx:
+            yield from search_index_files(
+                idx, files, query, search_type, prefer, cache_dir, stats
+            )
+        return
+
+    if jobs <= 1 or len(files) <= 1:
+        for file in files:
+            yield search_file(
+                file,
+                query,
+                search_type,
+                prefer,
+                cache_dir,
+                stats,
+                engine,
+                cross_sentences,
+            )
+        return
+
+    worker = partial(
+        _search_file_with_stats,
+        query=query,
+        search_type=search_type,
+        prefer=prefer,
+        cache_dir=cache_dir,
+        engine=engine,
+        cross_sentences=cross_sentences,
+    )
+
+    # only keep a few files in flight, so that nothing more than needed gets
+    # searched when the caller stops early
+    pending: deque = deque()
+    remaining = iter(files)
+
+    # reseed each worker, otherwise forked workers share the same random state
+    with ProcessPoolExecutor(max_workers=jobs, initializer=random.seed) as pool:
+        for file in islice(remaining, jobs * 2):
+            pending.append(pool.submit(worker, file))
+        try:
+            while pending:
+                result, file_stats = pending.popleft().result()
+                for file in islice(remaining, 1):
+                    pending.append(pool.submit(worker, file))
+                if stats is not None:
+                    for key, value in file_stats.items():
+                        stats[key] = stats.get(key, 0) + value
+                yield result
+        finally:
+            # don't search files nobody is waiting for when stopped early
+            for future in pending:
+                future.cancel()
+
+
+def _search_file_with_stats(file: str, **kwargs) -> Tuple[List[dict], dict]:
+    """Runs search_file() in a worker process, returning its stats along with the results"""
+    stats: Dict[str, int] = {}
+    return search_file(file, stats=stats, **kwargs), stats
+
+
+def search_file(
+    file: str,
+    query: List[str],
+    search_type: str = "sentence",
+    prefer: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    stats: Optional[dict] = None,
+    engine: str = "line",
+    cross_sentences: bool = False,
+) -> List[dict]:
+    """
+    Searches for a list of queries in a single video file
+
+    :param file str: Video file path
+    :param query List[str]: List of queries
+    :param search_type str: Return timestamps for "sentence" or "fragment"
+    :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :param stats dict: Optional dict to add the number of "candidates" checked and "pruned" by the literal prefilter to
+    :param engine str: Sentence search engine. "line" searches each sentence, "buffer" scans each transcript as a whole
+    :param cross_sentences bool: With the "buffer" engine, also return matches spanning several sentences
+    :rtype List[dict]: Matching timestamps, sorted by start time
+    """
+
+    segments = []
+    transcript = _parse_transcript(file, prefer, cache_dir)
+    if transcript is None:
+        return []
+
+    if search_type == "sentence" and engine == "buffer":
+        for first, query_index, last in scan_transcript(
+            transcript, query, cross_sentences
+        ):
+            segments.append(
+                {
+                    "file": file,
+                    "start": transcript.start(first),
+                    "end": transcript.end(last),
+                    "content": " ".join(transcript.contents[first : last + 1]),
+                    "query": query[query_index],
+                }
+            )
+
+    elif search_type == "sentence":
+        matcher = compile_queries(tuple(query))
+        for i, content in enumerate(transcript.contents):
+            for query_index in matcher.matches(content, stats):
+                segments.append(
+                    {
+                        "file": file,
+                        "start": transcript.start(i),
+                        "end": transcript.end(i),
+                        "content": content,
+                        "query": query[query_index],
+                    }
+                )
+
+    elif search_type == "fragment":
+        if not transcript.word_level:
+            print("Could not find word-level timestamps for", file)
+            return []
+
+        for _query in query:
+            queries = _query.split(" ")
+            queries = [q.strip() for q in queries if q.strip() != ""]
+            for start in transcript.find_fragments(queries):
+                end = start + len(queries)
+                phrase = " ".join([transcript.word(p) for p in range(start, end)])
+                segments.append(
+                    {
+                        "file": file,
+                        "start": transcript.starts[start],
+                        "end": transcript.ends[end - 1],
+                        "content": phrase,
+                        "query": _query,
+                    }
+                )
+
+    segments = sorted(segments, key=lambda k: k["start"])
+
+    return segments
+
+
+def scan_transcript(
+    transcript: Transcript, query: List[str], cross_sentences: bool = False
+) -> List[Tuple[int, int, int]]:
+    """
+    Searches a transcript with a single regex pass per query over all of its
+    sentences. Queries that can't be run over the whole transcript, ie. ones
+    with lookarounds, are searched sentence by sentence instead.
+
+    :param transcript Transcript: Transcript to search
+    :param query List[str]: List of queries
+    :param cross_sentences bool: Also return matches spanning several sentences
+    :rtype List[Tuple[int, int, int]]: (first sentence, query index, last sentence) of each match, in order
+    """
+
+    hits = []
+    for query_index, _query in enumerate(query):
+        pattern = scan_pattern(_query)
+        found = None
+        if pattern is not None:
+            found = transcript.scan(pattern, cross_sentences)
+
+        if found is None:
+            plan = compile_queries((_query,)).plans[0]
+            found = [
+                (i, i)
+                for i, content in enumerate(transcript.contents)
+                if plan.search(content)
+            ]
+
+        for first, last in found:
+            hits.append((first, query_index, last))
+
+    return sorted(hits)
+
+
+def search_index(
+    idx: Index,
+    file: str,
+    query: List[str],
+    search_type: str = "sentence",
+    prefer: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    stats: Optional[dict] = None,
+) -> List[dict]:
+    """
+    Searches for a list of queries in a single video file using a persistent
+    word index.
+
+    :param idx Index: Word index
+    :param file str: Video file path
+    :param query List[str]: List of queries
+    :param search_type str: Return timestamps for "sentence" or "fragment"
+    :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :param stats dict: Optional dict to add the number of "candidates" checked and "pruned" by the literal prefilter to
+    :rtype List[dict]: Matching timestamps, sorted by start time
+    """
+    return next(
+        search_index_files(idx, [file], query, search_type, prefer, cache_dir, stats)
+    )
+
+
+def search_index_files(
+    idx: Index,
+    files: List[str],
+    query: List[str],
+    search_type: str = "sentence",
+    prefer: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    stats: Optional[dict] = None,
+) -> Iterator[List[dict]]:
+    """
+    Searches for a list of queries in video files using a persistent word
+    index. The files are indexed first, then each query is looked up once
+    for all of them, so files without any matching words are never read.
+
+    :param idx Index: Word index
+    :param files List[str]: Video file paths
+    :param query List[str]: List of queries
+    :param search_type str: Return timestamps for "sentence" or "fragment"
+    :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :param stats dict: Optional dict to add the number of "candidates" checked and "pruned" by the literal prefilter to
+    :rtype Iterator[List[dict]]: Matching timestamps of each file, sorted by start time, in the order of files
+    """
+
+    file_ids = {}
+    for file in files:
+        file_id = _index_transcript(idx, file, prefer, cache_dir)
+        if file_id is None:
+            continue
+        if search_type == "fragment" and not idx.is_word_level(file_id):
+            print("Could not find word-level timestamps for", file)
+            continue
+        file_ids[file] = file_id
+
+    ids = sorted(set(file_ids.values()))
+    # hits of each file id, as (order, segment)
+    hits: Dict[int, list] = dict((file_id, []) for file_id in ids)
+
+    if search_type == "sentence":
+        plans = compile_queries(tuple(query)).plans
+        for query_index, plan in enumerate(plans):
+            candidates = idx.candidate_sentences(ids, plan.query)
+            for file_id in ids:
+                if candidates is None:
+                    rows = idx.sentences(file_id)
+                elif file_id in candidates:
+                    rows = idx.sentences(file_id, candidates[file_id])
+                else:
+                    continue
+                pruned = 0
+                for sentence, start, end, content in rows:
+                    if not plan.possible(content):
+                        pruned += 1
+                    elif plan.pattern.search(content):
+                        segment = {
+                            "start": start,
+                            "end": end,
+                            "content": content,
+                            "query": query[query_index],
+                        }
+                        hits[file_id].append(((sentence, query_index), segment))
+                if stats is not None:
+                    stats["candidates"] = stats.get("candidates", 0) + len(rows)
+                    stats["pruned"] = stats.get("pruned", 0) + pruned
+
+    elif search_type == "fragment":
+        for query_index, _query in enumerate(query):
+            queries = _query.split(" ")
+            queries = [q.strip() for q in queries if q.strip() != ""]
+            for file_id, fragments in idx.fragments(ids, queries).items():
+                for fragment in fragments:
+                    fragment["query"] = _query
+                    hits[file_id].append(((query_index,), fragment))
 
     for file in files:
+        if file not in file_ids:
+            yield []
+            continue
+
         segments = []
-        transcript = parse_transcript(file, prefer=prefer)
+        for _, segment in sorted(hits[file_ids[file]], key=lambda k: k[0]):
+            segments.append({"file": file, **segment})
+
+        segments = sorted(segments, key=lambda k: k["start"])
+        yield segments
+
+
+def _index_transcript(
+    idx: Index, file: str, prefer: Optional[str], cache_dir: Optional[str]
+) -> Optional[int]:
+    """
+    Gets the index id of a video's transcript. Transcripts that are missing
+    from the index, or have changed since they were indexed, are parsed and
+    (re-)indexed first.
+    """
+
+    subfile = find_transcript(file, prefer)
+    if subfile is None:
+        print("No subtitle file found for ", file)
+        return None
+
+    file_id = idx.lookup(subfile)
+    if file_id is None:
+        transcript = load_transcript(subfile, cache_dir)
         if transcript is None:
-            continue
+            return None
+        file_id = idx.update(subfile, transcript)
 
-        if search_type == "sentence":
-            for line in transcript:
-                for _query in query:
-                    if re.search(_query, line["content"]):
-                        segments.append(
-                            {
-                                "file": file,
-                                "start": line["start"],
-                                "end": line["end"],
-                                "content": line["content"],
-                            }
-                        )
-
-        elif search_type == "fragment":
-            if "words" not in transcript[0]:
-                print("Could not find word-level timestamps for", file)
-                continue
+    return file_id
 
-            words = []
-            for line in transcript:
-                words += line["words"]
 
-            for _query in query:
-                queries = _query.split(" ")
-                queries = [q.strip() for q in queries if q.strip() != ""]
-                fragments = zip(*[words[i:] for i in range(len(queries))])
-                for fragment in fragments:
-                    found = all(
-                        re.search(q, w["word"]) for q, w in zip(queries, fragment)
-                    )
-                    if found:
-                        phrase = " ".join([w["word"] for w in fragment])
-                        segments.append(
-                            {
-                                "file": file,
-                                "start": fragment[0]["start"],
-                                "end": fragment[-1]["end"],
-                                "content": phrase,
-                            }
-                        )
-
-        elif search_type == "mash":
-            if "words" not in transcript[0]:
+def mash(
+    files: Union[str, list],
+    query: Union[str, list],
+    prefer: Optional[str] = None,
+    index: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+) -> List[dict]:
+    """
+    Makes a "mash" by picking a random occurrence of each word in the query
+    from any of the files. Words that can't be found are skipped.
+
+    :param files Union[str, list]: List of files or file
+    :param query Union[str, list]: Words to look for, or a list of queries
+    :param prefer str: Transcript file type preference. Can be vtt, srt, or json
+    :param index str: Path to a persistent word index to search with (created if missing)
+    :param cache_dir str: Folder to cache parsed transcripts in
+    :rtype List[dict]: Timestamps of the words, grouped by file and sorted by start time
+    """
+    if not isinstance(files, list):
+        files = [files]
+
+    if not isinstance(query, list):
+        query = [query]
+
+    words = [q for _query in query for q in _query.split(" ")]
+    picks: Dict[str, List[dict]] = dict((file, []) for file in files)
+
+    if index is not None:
+        with Index(index) as idx:
+            file_ids = {}
+            for file in picks:
+                file_id = _index_transcript(idx, file, prefer, cache_dir)
+                if file_id is None:
+                    continue
+                if not idx.is_word_level(file_id):
+                    print("Could not find word-level timestamps for", file)
+                    continue
+                file_ids[file_id] = file
+
+            for q in words:
+                matches = idx.occurrences(q, list(file_ids))
+                if len(matches) == 0:
+                    print("Could not find", q, "in transcript")
+                    continue
+                file_id, start, end, content = random.choice(matches)
+                picks[file_ids[file_id]].append(
+                    {
+                        "file": file_ids[file_id],
+                        "start": start,
+                        "end": end,
+                        "content": content,
+                    }
+                )
+
+    else:
+        transcripts = []
+        for file in picks:
+            transcript = _parse_transcript(file, prefer, cache_dir)
+            if transcript is None:
+                continue
+            if not transcript.word_level:
                 print("Could not find word-level timestamps for", file)
                 continue
+            transcripts.append((file, transcript))
 
-            words = []
-            for line in transcript:
-                words += line["words"]
-
-            for _query in query:
-                queries = _query.split(" ")
-
-                for q in queries:
-                    matches = [w for w in words if w["word"].lower() == q.lower()]
-                    if len(matches) == 0:
-                        print("Could not find", q, "in transcript")
-                        return []
-                    random.shuffle(matches)
-                    word = matches[0]
-                    segments.append(
+        for q in words:
+            matches = [(file, t, t.find_word(q)) for file, t in transcripts]
+            total = sum(len(positions) for _, _, positions in matches)
+            if total == 0:
+                print("Could not find", q, "in transcript")
+                continue
+
+            # pick uniformly from every occurrence in every file
+            pick = random.randrange(total)
+            for file, transcript, positions in matches:
+                if pick < len(positions):
+                    p = positions[pick]
+                    picks[file].append(
                         {
                             "file": file,
-                            "start": word["start"],
-                            "end": word["end"],
-                            "content": word["word"],
+                            "start": transcript.starts[p],
+                            "end": transcript.ends[p],
+                            "content": transcript.word(p),
                         }
                     )
+                    break
+                pick -= len(positions)
 
-        segments = sorted(segments, key=lambda k: k["start"])
+    segments = []
+    for file_segments in picks.values():
+        segments += sorted(file_segments, key=lambda k: k["start"])
 
-        all_segments += segments
-
-    return all_segments
+    return segments
 
 
 def get_file_type(filename: str):
@@ -315,6 +882,8 @@ def get_input_type(composition: List[dict]):
     """
     Get input type of files ('audio' or 'video') for inputs based on the
     IANA Media Type, aka MIME type, and using videgrep's composition dict.
+    Inputs that exist are probed, since some containers (.mp4, .webm, .ogg)
+    can hold either audio or video.
 
     :param composition List[dict]: List of timestamps in the format [{start, end, file}]
     """
@@ -323,6 +892,13 @@ def get_input_type(composition: List[dict]):
 
     for f in filenames:
         type = get_file_type(f)
+        info = None
+        if type in ["audio", "video", "unknown"] and os.path.isfile(f):
+            info = probe(f)
+        if info is not None and info["video"] is not None:
+            type = "video"
+        elif info is not None and info["audio"] is not None:
+            type = "audio"
         types.append(type)
 
     if "audio" in types:
@@ -385,79 +961,216 @@ def plan_audio_output(composition: List[dict], outputfile: str):
         return False
 
 
-def create_supercut(composition: List[dict], outputfile: str):
+def create_supercut(
+    composition: List[dict],
+    outputfile: str,
+    cache_dir: Optional[str] = None,
+    cache_size: int = CLIP_CACHE_SIZE,
+):
     """
-    Concatenate video clips together.
+    Concatenate video clips together. Audio clips are decoded and piped to a
+    single ffmpeg encoder, or cut from decoded copies of whole files kept in
+    cache_dir if it is given.
 
     :param composition List[dict]: List of timestamps in the format [{start, end, file}]
     :param outputfile str: Path to save the video to
+    :param cache_dir Optional[str]: Folder to keep decoded audio in
+    :param cache_size int: Megabytes of rendered clips and decoded audio to keep in the cache
     """
 
-    all_filenames = set([c["file"] for c in composition])
-
     if plan_no_action(composition, outputfile):
         print("Videogrep is not able to convert audio input to video output.")
         print("Try using an audio output instead, like 'supercut.mp3'.")
         sys.exit("Exiting...")
     elif plan_video_output(composition, outputfile):
         print("[+] Creating clips.")
-        videofileclips = dict([(f, VideoFileClip(f)) for f in all_filenames])
-        cut_clips = []
-        for c in composition:
-            if c["start"] < 0:
-                c["start"] = 0
-            if c["end"] > videofileclips[c["file"]].duration:
-                c["end"] = videofileclips[c["file"]].duration
-            cut_clips.append(videofileclips[c["file"]].subclip(c["start"], c["end"]))
+        with ReaderPool() as pool:
+            cut_clips = pool.cut(composition)
 
-        print("[+] Concatenating clips.")
-        final_clip = concatenate_videoclips(cut_clips, method="compose")
+            print("[+] Concatenating clips.")
+            final_clip = concatenate_videoclips(cut_clips, method="compose")
 
-        print("[+] Writing ouput file.")
-        final_clip.write_videofile(
-            outputfile,
-            codec="libx264",
-            temp_audiofile=f"{outputfile}_temp-audio{time.time()}.m4a",
-            remove_temp=True,
-            audio_codec="aac",
-        )
+            print("[+] Writing ouput file.")
+            final_clip.write_videofile(
+                outputfile,
+                codec="libx264",
+                temp_audiofile=f"{outputfile}_temp-audio{time.time()}.m4a",
+                remove_temp=True,
+                audio_codec="aac",
+            )
     elif plan_audio_output(composition, outputfile):
+        if outputfile == "supercut.mp4":
+            outputfile = "supercut.mp3"
+
+        if cache_dir is not None:
+            if pcm.create_supercut_pcm(composition, outputfile, cache_dir):
+                clipcache.evict(cache_dir, cache_size)
+                return
+        elif render.create_supercut_stream(composition, outputfile, video=False):
+            return
+
         print("[+] Creating clips.")
-        audiofileclips = dict([(f, AudioFileClip(f)) for f in all_filenames])
-        cut_clips = []
+        with ReaderPool(audio_only=True) as pool:
+            cut_clips = pool.cut(composition)
 
-        for c in composition:
-            if c["start"] < 0:
-                c["start"] = 0
-            if c["end"] > audiofileclips[c["file"]].duration:
-                c["end"] = audiofileclips[c["file"]].duration
-            cut_clips.append(audiofileclips[c["file"]].subclip(c["start"], c["end"]))
+            print("[+] Concatenating clips.")
+            final_clip = concatenate_audioclips(cut_clips)
+
+            print("[+] Writing output file.")
+
+            # we don't currently use this, but may be useful for certain libraries
+            outputformat = outputfile.split(".")[-1]
 
-        print("[+] Concatenating clips.")
-        final_clip = concatenate_audioclips(cut_clips)
+            final_clip.write_audiofile(outputfile)
 
-        print("[+] Writing output file.")
+
+def create_supercut_stream(composition: List[dict], outputfile: str) -> bool:
+    """
+    Concatenate clips by piping them to a single ffmpeg encoder, which uses
+    the same amount of memory however long the supercut is.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the video to
+    :rtype bool: False if the clips couldn't be rendered
+    """
+
+    if plan_no_action(composition, outputfile):
+        print("Videogrep is not able to convert audio input to video output.")
+        print("Try using an audio output instead, like 'supercut.mp3'.")
+        sys.exit("Exiting...")
+    elif plan_video_output(composition, outputfile):
+        return render.create_supercut_stream(composition, outputfile)
+    elif plan_audio_output(composition, outputfile):
         if outputfile == "supercut.mp4":
             outputfile = "supercut.mp3"
+        print("[+] Encoding audio.")
+        return render.create_supercut_stream(composition, outputfile, video=False)
 
-        # we don't currently use this, but may be useful for certain libraries
-        outputformat = outputfile.split(".")[-1]
+    return False
 
-        final_clip.write_audiofile(outputfile)
 
-
-def create_supercut_in_batches(composition: List[dict], outputfile: str):
+def create_supercut_cached(
+    composition: List[dict],
+    outputfile: str,
+    cache_dir: str,
+    cache_size: int = CLIP_CACHE_SIZE,
+) -> bool:
     """
-    Concatenate video clips together in groups of size BATCH_SIZE.
+    Concatenate clips that are encoded once and kept in a cache, so that
+    later supercuts with the same clips only need to join them.
 
     :param composition List[dict]: List of timestamps in the format [{start, end, file}]
     :param outputfile str: Path to save the video to
+    :param cache_dir str: Folder to cache rendered clips in
+    :param cache_size int: Megabytes of rendered clips to keep in the cache
+    :rtype bool: False if the clips couldn't be rendered
     """
-    total_clips = len(composition)
-    start_index = 0
-    end_index = BATCH_SIZE
-    batch_comp = []
 
+    if plan_no_action(composition, outputfile):
+        print("Videogrep is not able to convert audio input to video output.")
+        print("Try using an audio output instead, like 'supercut.mp3'.")
+        sys.exit("Exiting...")
+    elif plan_video_output(composition, outputfile):
+        return clipcache.create_supercut_cached(
+            composition, outputfile, cache_dir, cache_size
+        )
+    elif plan_audio_output(composition, outputfile):
+        if outputfile == "supercut.mp4":
+            outputfile = "supercut.mp3"
+        return clipcache.create_supercut_cached(
+            composition, outputfile, cache_dir, cache_size, video=False
+        )
+
+    return False
+
+
+def reader_memory(filename: str) -> int:
+    """
+    Estimates how much memory moviepy needs to keep a file open while rendering
+
+    :param filename str: Media file path
+    :rtype int: Size in bytes
+    """
+    info = probe(filename)
+    if info is None:
+        return READER_OVERHEAD + 1920 * 1080 * 3 * READER_FRAMES
+    if info["video"] is None:
+        return READER_OVERHEAD
+    frame = (info["video"]["width"] or 1920) * (info["video"]["height"] or 1080) * 3
+    return READER_OVERHEAD + frame * READER_FRAMES
+
+
+def plan_batches(
+    composition: List[dict],
+    memory: int = BATCH_MEMORY,
+    duration: float = BATCH_DURATION,
+) -> List[List[dict]]:
+    """
+    Splits a composition into batches that can each be rendered within a
+    memory budget. A batch grows until the files it opens, the frames it
+    composes, its length or its number of clips would go over the limits.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param memory int: Megabytes of memory to render a batch with
+    :param duration float: Most seconds of video in a batch
+    :rtype List[List[dict]]: Batches of clips, in order
+    """
+    budget = memory * 1024 * 1024
+    batches = []
+    batch = []
+    readers = {}
+    length = 0
+
+    for c in composition:
+        readers_after = dict(readers)
+        if c["file"] not in readers_after:
+            readers_after[c["file"]] = reader_memory(c["file"])
+
+        # at most READER_POOL_SIZE files are open at once, and frames are
+        # composed onto a canvas as large as the biggest one
+        largest = sorted(readers_after.values(), reverse=True)
+        needed = sum(largest[:READER_POOL_SIZE])
+        needed += max(readers_after.values()) - READER_OVERHEAD
+        clip_length = c["end"] - c["start"]
+
+        if len(batch) > 0 and (
+            needed > budget
+            or length + clip_length > duration
+            or len(batch) >= BATCH_SIZE
+        ):
+            batches.append(batch)
+            batch = []
+            readers_after = {c["file"]: reader_memory(c["file"])}
+            length = 0
+
+        batch.append(c)
+        readers = readers_after
+        length += clip_length
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+def create_supercut_in_batches(
+    composition: List[dict],
+    outputfile: str,
+    jobs: int = 1,
+    memory: int = BATCH_MEMORY,
+    resume: bool = False,
+):
+    """
+    Concatenate video clips together in batches that fit in a memory budget.
+    Finished batches are recorded in a manifest next to the output, so that
+    a render that was interrupted can be resumed.
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param outputfile str: Path to save the video to
+    :param jobs int: Number of batches to render at the same time
+    :param memory int: Megabytes of memory to render with, shared between jobs
+    :param resume bool: Reuse batches recorded by an earlier, unfinished render
+    """
     if plan_no_action(composition, outputfile):
         print("Videogrep is not able to convert audio input to video output.")
         print("Try using an audio output instead, like 'supercut.mp3'.")
@@ -469,20 +1182,67 @@ def create_supercut_in_batches(composition: List[dict], outputfile: str):
         if outputfile == "supercut.mp4":
             outputfile = "supercut.mp3"
 
-    while start_index < total_clips:
+    batches = []
+    start_index = 0
+    for batch in plan_batches(composition, memory // max(jobs, 1)):
         filename = outputfile + ".tmp" + str(start_index) + file_ext
-        try:
-            create_supercut(composition[start_index:end_index], filename)
+        batches.append((batch, filename))
+        start_index += len(batch)
+
+    manifest = outputfile + ".manifest.json"
+    recorded = load_manifest(manifest) if resume else {}
+
+    # each batch, or the halves it was split into by an earlier render, as
+    # (batch, filename, finished)
+    parts = []
+    for batch, filename in batches:
+        parts += resume_batch(batch, filename, recorded)
+
+    finished = dict(
+        [(filename, batch_hash(batch)) for batch, filename, done in parts if done]
+    )
+    # remove batches that are no longer part of the supercut
+    for filename in recorded:
+        if filename not in finished and filename.startswith(outputfile + ".tmp"):
+            if os.path.exists(filename):
+                os.remove(filename)
+    save_manifest(manifest, finished)
+    if resume:
+        print(f"[+] Resuming with {len(finished)} of {len(parts)} batches done.")
+
+    def done(batch: List[dict], filename: str):
+        finished[filename] = batch_hash(batch)
+        save_manifest(manifest, finished)
+
+    pending = [(b, f) for b, f, d in parts if not d]
+    rendered, missing = _render_batches(pending, jobs, done)
+    rendered = iter(rendered)
+    if missing > 0:
+        print(f"[!] {missing} clips were left out of the supercut.")
+
+    batch_comp = []
+    for batch, filename, done_before in parts:
+        if done_before:
             batch_comp.append(filename)
-            gc.collect()
-            start_index += BATCH_SIZE
-            end_index += BATCH_SIZE
-        except Exception as e:
-            start_index += BATCH_SIZE
-            end_index += BATCH_SIZE
-            next
+        else:
+            batch_comp += next(rendered)
 
+    if len(batch_comp) == 0:
+        print("[!] No batches could be rendered.")
+        return
+
+    # every batch is encoded with the same settings, so they can usually be
+    # joined without being decoded and encoded a second time
     if plan_video_output(composition, outputfile):
+        joinable = render.join_format(batch_comp, outputfile)
+    else:
+        joinable = os.path.splitext(outputfile)[1].lower() == file_ext
+
+    print("[+] Joining batches.")
+    joined = joinable and render.join_files(batch_comp, outputfile)
+
+    if not joined and plan_video_output(composition, outputfile):
+        print("[+] Batches can't be joined without re-encoding.")
         clips = [VideoFileClip(filename) for filename in batch_comp]
         video = concatenate_videoclips(clips, method="compose")
         video.write_videofile(
@@ -492,7 +1252,8 @@ def create_supercut_in_batches(composition: List[dict], outputfile: str):
             remove_temp=True,
             audio_codec="aac",
         )
-    elif plan_audio_output(composition, outputfile):
+    elif not joined and plan_audio_output(composition, outputfile):
+        print("[+] Batches can't be joined without re-encoding.")
         clips = [AudioFileClip(filename) for filename in batch_comp]
         audio = concatenate_audioclips(clips)
         audio.write_audiofile(outputfile)
@@ -500,64 +1261,287 @@ def create_supercut_in_batches(composition: List[dict], outputfile: str):
     # remove partial video files
     for filename in batch_comp:
         os.remove(filename)
+    os.remove(manifest)
 
     cleanup_log_files(outputfile)
 
 
-def export_individual_clips(composition: List[dict], outputfile: str):
+def resume_batch(
+    batch: List[dict], filename: str, recorded: Dict[str, str]
+) -> List[Tuple[List[dict], str, bool]]:
+    """
+    Finds the parts of a batch that an earlier render finished. A batch
+    that ran out of memory was split into halves named after it, which may
+    have been split again, so those are looked for too.
+
+    :param batch List[dict]: The clips of the batch
+    :param filename str: File the batch is rendered to
+    :param recorded Dict[str, str]: Finished batches from load_manifest()
+    :rtype List[Tuple[List[dict], str, bool]]: (batch, filename, finished) of each part, in order
+    """
+    if recorded.get(filename) == batch_hash(batch) and os.path.exists(filename):
+        return [(batch, filename, True)]
+
+    root, ext = os.path.splitext(filename)
+    if len(batch) > 1 and any(f.startswith(root + "-") for f in recorded):
+        half = len(batch) // 2
+        parts = resume_batch(batch[:half], root + "-0" + ext, recorded)
+        parts += resume_batch(batch[half:], root + "-1" + ext, recorded)
+        if any(done for _, _, done in parts):
+            return parts
+
+    return [(batch, filename, False)]
+
+
+def batch_hash(composition: List[dict]) -> str:
+    """
+    Hashes the clips of a batch, along with the state of their source
+    files, to check that a rendered batch still matches
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :rtype str: Hex digest
+    """
+    clips = []
+    for c in composition:
+        stamp = None
+        if os.path.exists(c["file"]):
+            stamp = list(cache.file_stamp(c["file"]))
+        clips.append([os.path.abspath(c["file"]), stamp, c["start"], c["end"]])
+    return hashlib.sha1(json.dumps(clips).encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest: str) -> Dict[str, str]:
+    """
+    Reads the batches recorded by an earlier render
+
+    :param manifest str: Path to the manifest
+    :rtype Dict[str, str]: Hash of each finished batch, by filename
+    """
+    try:
+        with open(manifest, "r", encoding="utf8") as infile:
+            return json.load(infile)["batches"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_manifest(manifest: str, finished: Dict[str, str]):
+    """
+    Records the batches that have been rendered
+
+    :param manifest str: Path to the manifest
+    :param finished Dict[str, str]: Hash of each finished batch, by filename
+    """
+    tmpname = manifest + ".tmp"
+    with open(tmpname, "w", encoding="utf8") as outfile:
+        json.dump({"batches": finished}, outfile)
+    os.replace(tmpname, manifest)
+
+
+def render_batches(
+    batches: List[Tuple[List[dict], str]],
+    jobs: int = 1,
+    done: Optional[Callable[[List[dict], str], None]] = None,
+) -> List[str]:
+    """
+    Renders batches of clips to separate files, using up to jobs processes.
+    A batch that runs out of memory is split in half and tried again. Any
+    other failure is reported and the batch is left out, without stopping
+    the others.
+
+    :param batches List[Tuple[List[dict], str]]: List of (composition, filename) for each batch
+    :param jobs int: Number of batches to render at the same time
+    :param done Optional[Callable[[List[dict], str], None]]: Called with each batch as soon as it has been rendered
+    :rtype List[str]: Files of the batches that were rendered, in the original order
+    """
+
+    rendered, missing = _render_batches(batches, jobs, done)
+
+    if missing > 0:
+        print(f"[!] {missing} clips were left out of the supercut.")
+
+    return [filename for files in rendered for filename in files]
+
+
+def _render_batches(
+    batches: List[Tuple[List[dict], str]],
+    jobs: int,
+    done: Optional[Callable[[List[dict], str], None]] = None,
+) -> Tuple[List[List[str]], int]:
+    results = [None] * len(batches)
+    if jobs <= 1 or len(batches) <= 1:
+        for index, (batch, filename) in enumerate(batches):
+            try:
+                render_batch(batch, filename)
+            except Exception as e:
+                results[index] = e
+                continue
+            if done is not None:
+                done(batch, filename)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = dict(
+                [
+                    (pool.submit(render_batch, b, f), i)
+                    for i, (b, f) in enumerate(batches)
+                ]
+            )
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.exception()
+                if results[index] is None and done is not None:
+                    done(*batches[index])
+
+    rendered = []
+    missing = 0
+    retries = []
+    for index, ((batch, filename), error) in enumerate(zip(batches, results)):
+        if error is None:
+            rendered.append([filename])
+            continue
+
+        rendered.append([])
+        if os.path.exists(filename):
+            os.remove(filename)
+
+        if _out_of_memory(error) and len(batch) > 1:
+            print(
+                f"[!] Batch {index + 1} of {len(batches)} ran out of memory, splitting it."
+            )
+            half = len(batch) // 2
+            root, ext = os.path.splitext(filename)
+            retries.append((index, (batch[:half], root + "-0" + ext)))
+            retries.append((index, (batch[half:], root + "-1" + ext)))
+        else:
+            missing += len(batch)
+            print(f"[!] Batch {index + 1} of {len(batches)} failed: {error}")
+
+    if len(retries) > 0:
+        retried, retry_missing = _render_batches([r for _, r in retries], jobs, done)
+        missing += retry_missing
+        for (index, _), files in zip(retries, retried):
+            rendered[index] += files
+
+    return rendered, missing
+
+
+def _out_of_memory(error: BaseException) -> bool:
+    """Checks if a batch failed for lack of memory, including a worker process being killed"""
+    if isinstance(error, (MemoryError, BrokenProcessPool)):
+        return True
+    return "Cannot allocate memory" in str(error)
+
+
+def render_batch(composition: List[dict], filename: str):
+    """
+    Renders one batch of clips, freeing moviepy's resources afterwards
+
+    :param composition List[dict]: List of timestamps in the format [{start, end, file}]
+    :param filename str: Path to save the batch to
+    """
+    create_supercut(composition, filename)
+    gc.collect()
+
+
+def export_individual_clips(
+    composition: List[dict],
+    outputfile: str,
+    cache_dir: Optional[str] = None,
+    cache_size: int = CLIP_CACHE_SIZE,
+    jobs: int = 1,
+    renderer: str = "moviepy",
+):
     """
     Exports videogrep composition to individual clips.
 
     :param composition List[dict]: List of timestamps in the format [{start, end, file}]
     :param outputfile str: Path to save the videos to
+    :param cache_dir Optional[str]: Folder to cache rendered clips in
+    :param cache_size int: Megabytes of rendered clips to keep in the cache
+    :param jobs int: Number of clips to write at the same time
+    :param renderer str: "moviepy" to re-encode every clip, or "copy" to cut them with ffmpeg without re-encoding
     """
 
-    all_filenames = set([c["file"] for c in composition])
-
     if plan_no_action(composition, outputfile):
         print("Videogrep is not able to convert audio input to video output.")
         print("Try using an audio output instead, like 'supercut.mp3'.")
         sys.exit("Exiting...")
-    elif plan_video_output(composition, outputfile):
-        videofileclips = dict([(f, VideoFileClip(f)) for f in all_filenames])
-        cut_clips = []
-        for c in composition:
+    elif renderer == "copy" and plan_video_output(composition, outputfile):
+        if render.export_clips_copy(composition, outputfile, jobs):
+            return
+    elif cache_dir is not None and plan_video_output(composition, outputfile):
+        if clipcache.export_clips_cached(
+            composition, outputfile, cache_dir, cache_size
+        ):
+            return
+    elif cache_dir is not None and plan_audio_output(composition, outputfile):
+        audiofile = "supercut.mp3" if outputfile == "supercut.mp4" else outputfile
+        if clipcache.export_clips_cached(
+            composition, audiofile, cache_dir, cache_size, video=False
+        ):
+            return
+
+    video = plan_video_output(composition, outputfile)
+    if not video and outputfile == "supercut.mp4":
+        outputfile = "supercut.mp3"
+
+    # clips are written grouped by file, so that each file is opened once by
+    # each group, and groups are spread across processes
+    basename, ext = os.path.splitext(outputfile)
+    groups = []
+    for filename, indexes in groupby(
+        group_by_source(composition), key=lambda i: composition[i]["file"]
+    ):
+        clips = [
+            (composition[i], basename + "_" + str(i).zfill(5) + ext) for i in indexes
+        ]
+        for start in range(0, len(clips), BATCH_SIZE):
+            groups.append(clips[start : start + BATCH_SIZE])
+
+    print("[+] Writing output files.")
+    errors = []
+    if jobs <= 1 or len(groups) <= 1:
+        for group in groups:
+            try:
+                export_clips(group, video)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(export_clips, group, video) for group in groups]
+            for future in futures:
+                errors.append(future.exception())
+
+    for group, error in zip(groups, errors):
+        if error is not None:
+            print(f"[!] {len(group)} clips from {group[0][0]['file']} failed: {error}")
+
+
+def export_clips(clips: List[Tuple[dict, str]], video: bool = True):
+    """
+    Writes clips to their own files with moviepy
+
+    :param clips List[Tuple[dict, str]]: List of ({start, end, file}, filename) for each clip
+    :param video bool: Write video with audio, rather than only audio
+    """
+    with ReaderPool(audio_only=not video) as pool:
+        for c, clipfilename in clips:
+            source = pool.get(c["file"])
             if c["start"] < 0:
                 c["start"] = 0
-            if c["end"] > videofileclips[c["file"]].duration:
-                c["end"] = videofileclips[c["file"]].duration
-            cut_clips.append(videofileclips[c["file"]].subclip(c["start"], c["end"]))
-
-        basename, ext = os.path.splitext(outputfile)
-        print("[+] Writing output files.")
-        for i, clip in enumerate(cut_clips):
-            clipfilename = basename + "_" + str(i).zfill(5) + ext
+            if c["end"] > source.duration:
+                c["end"] = source.duration
+            clip = source.subclip(c["start"], c["end"])
+            if not video:
+                clip.write_audiofile(clipfilename)
+                continue
             clip.write_videofile(
                 clipfilename,
                 codec="libx264",
-                temp_audiofile="{clipfilename}_temp-audio.m4a",
+                temp_audiofile=f"{clipfilename}_temp-audio.m4a",
                 remove_temp=True,
                 audio_codec="aac",
             )
-    elif plan_audio_output(composition, outputfile):
-        audiofileclips = dict([(f, AudioFileClip(f)) for f in all_filenames])
-        cut_clips = []
-
-        for c in composition:
-            if c["start"] < 0:
-                c["start"] = 0
-            if c["end"] > audiofileclips[c["file"]].duration:
-                c["end"] = audiofileclips[c["file"]].duration
-            cut_clips.append(audiofileclips[c["file"]].subclip(c["start"], c["end"]))
-
-        if outputfile == "supercut.mp4":
-            outputfile = "supercut.mp3"
-
-        basename, ext = os.path.splitext(outputfile)
-        print("[+] Writing output files.")
-        for i, clip in enumerate(cut_clips):
-            clipfilename = basename + "_" + str(i).zfill(5) + ext
-            clip.write_audiofile(clipfilename)
 
 
 def export_m3u(composition: List[dict], outputfile: str):
@@ -627,6 +1611,16 @@ def videogrep(
     demo: bool = False,
     write_vtt: bool = False,
     preview: bool = False,
+    index: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    jobs: int = 1,
+    stats: bool = False,
+    engine: str = "line",
+    cross_sentences: bool = False,
+    renderer: str = "moviepy",
+    batch_memory: int = BATCH_MEMORY,
+    clip_cache_size: Optional[int] = None,
+    resume: bool = False,
 ):
     """
     Creates a supercut of videos based on a search query
@@ -642,67 +1636,153 @@ def videogrep(
     :param random_order bool: Randomize the order of clips (default False)
     :param demo bool: Show the results of the search but don't actually make a supercut
     :param write_vtt bool: Write a WebVTT file next to the supercut (default False)
+    :param index str: Path to a persistent word index to search with (created if missing)
+    :param cache_dir str: Folder to cache parsed transcripts, media probes and rendered clips in
+    :param jobs int: Number of processes to use
+    :param stats bool: Print how many sentences were skipped by the literal prefilter
+    :param engine str: Sentence search engine, "line" or "buffer"
+    :param cross_sentences bool: With the "buffer" engine, also match across sentences
+    :param renderer str: "moviepy" to re-encode every clip, "copy" to cut and join them with ffmpeg without re-encoding, or "stream" to pipe them to a single ffmpeg encoder
+    :param batch_memory int: Megabytes of memory to render long supercuts with, shared between jobs
+    :param clip_cache_size Optional[int]: Megabytes of rendered clips and decoded audio to keep in cache_dir. Neither is cached unless this is given
+    :param resume bool: Reuse the batches of an earlier render of the same supercut that didn't finish
     """
 
-    segments = search(files, query, search_type)
-
-    if len(segments) == 0:
-        if isinstance(query, list):
-            query = " ".join(query)
-        print("No results found for", query)
-        return False
-
-    # padding
-    segments = pad_and_sync(segments, padding=padding, resync=resync)
-
-    # random order
-    if random_order:
-        random.shuffle(segments)
-
-    # max clips
-    if maxclips != 0:
-        segments = segments[0:maxclips]
-
-    # demo and exit
-    if demo:
-        for s in segments:
-            print(s["file"], s["start"], s["end"], s["content"])
-        return True
-
-    # preview in mpv and exit
-    if preview:
-        lines = [f"{s['file']},{s['start']},{s['end']-s['start']}" for s in segments]
-        edl = "edl://" + ";".join(lines)
-        subprocess.run(["mpv", edl])
-        return True
-
-    # export individual clips
-    if export_clips:
-        export_individual_clips(segments, output)
-        return True
+    # probes are only cached in cache_dir for this run
+    if cache_dir is not None:
+        previous_cache_dir = set_cache_dir(cache_dir)
 
-    # m3u
-    if output.endswith(".m3u"):
-        export_m3u(segments, output)
-        return True
+    try:
+        # rendered clips and decoded audio are only cached when asked for, since
+        # they can take far more space than the transcripts
+        clip_cache_dir = None
+        if cache_dir is not None and clip_cache_size is not None:
+            clip_cache_dir = cache_dir
+        if clip_cache_size is None:
+            clip_cache_size = CLIP_CACHE_SIZE
 
-    # mpv edls
-    if output.endswith(".mpv.edl"):
-        export_mpv_edl(segments, output)
-        return True
+        # stop searching once there are enough clips, unless they get shuffled
+        stop_early = maxclips != 0 and not random_order
 
-    # fcp xml (compatible with premiere/davinci)
-    if output.endswith(".xml"):
-        export_xml(segments, output)
-        return True
+        segments = []
+        search_stats: Optional[dict] = {} if stats else None
+
+        # the search is closed as soon as there are enough clips, which shuts
+        # down its worker processes and index rather than leaving that to gc
+        with closing(
+            iter_search(
+                files,
+                query,
+                search_type,
+                index=index,
+                cache_dir=cache_dir,
+                jobs=jobs,
+                stats=search_stats,
+                engine=engine,
+                cross_sentences=cross_sentences,
+            )
+        ) as results:
+            # segments are padded one file at a time, since overlaps are only
+            # removed between clips from the same file
+            for _, group in groupby(results, key=lambda s: s["file"]):
+                group = pad_and_sync(list(group), padding=padding, resync=resync)
+
+                if stop_early:
+                    group = group[0 : maxclips - len(segments)]
+
+                # show results as soon as they are found
+                if demo and not random_order:
+                    for s in group:
+                        print(s["file"], s["start"], s["end"], s["content"])
+
+                segments += group
+
+                if stop_early and len(segments) >= maxclips:
+                    break
+
+        if search_stats is not None:
+            candidates = search_stats.get("candidates", 0)
+            pruned = search_stats.get("pruned", 0)
+            print(
+                f"Checked {candidates} sentences, {pruned} skipped by the literal prefilter"
+            )
 
-    # export supercut
-    if len(segments) > BATCH_SIZE:
-        create_supercut_in_batches(segments, output)
-    else:
-        create_supercut(segments, output)
+        if len(segments) == 0:
+            if isinstance(query, list):
+                query = " ".join(query)
+            print("No results found for", query)
+            return False
+
+        # random order
+        if random_order:
+            random.shuffle(segments)
+
+        # max clips
+        if maxclips != 0:
+            segments = segments[0:maxclips]
+
+        # demo and exit
+        if demo:
+            if random_order:
+                for s in segments:
+                    print(s["file"], s["start"], s["end"], s["content"])
+            return True
+
+        # preview in mpv and exit
+        if preview:
+            lines = [
+                f"{s['file']},{s['start']},{s['end']-s['start']}" for s in segments
+            ]
+            edl = "edl://" + ";".join(lines)
+            subprocess.run(["mpv", edl])
+            return True
+
+        # export individual clips
+        if export_clips:
+            export_individual_clips(
+                segments, output, clip_cache_dir, clip_cache_size, jobs, renderer
+            )
+            return True
+
+        # m3u
+        if output.endswith(".m3u"):
+            export_m3u(segments, output)
+            return True
+
+        # mpv edls
+        if output.endswith(".mpv.edl"):
+            export_mpv_edl(segments, output)
+            return True
+
+        # fcp xml (compatible with premiere/davinci)
+        if output.endswith(".xml"):
+            export_xml(segments, output)
+            return True
+
+        # export supercut, falling back to moviepy if the other renderers can't be used
+        rendered = False
+        if renderer == "copy":
+            rendered = render.create_supercut_copy(segments, output)
+        elif renderer == "stream":
+            rendered = create_supercut_stream(segments, output)
+        elif clip_cache_dir is not None and plan_video_output(segments, output):
+            rendered = create_supercut_cached(
+                segments, output, clip_cache_dir, clip_cache_size
+            )
 
-    # write WebVTT file
-    if write_vtt:
-        basename, ext = os.path.splitext(output)
-        vtt.render(segments, basename + ".vtt")
+        # audio is cut from decoded files in constant memory, so it needs no batches
+        batched = plan_video_output(segments, output) and (
+            len(plan_batches(segments, batch_memory // max(jobs, 1))) > 1
+        )
+        if not rendered and batched:
+            create_supercut_in_batches(segments, output, jobs, batch_memory, resume)
+        elif not rendered:
+            create_supercut(segments, output, clip_cache_dir, clip_cache_size)
+
+        # write WebVTT file
+        if write_vtt:
+            basename, ext = os.path.splitext(output)
+            vtt.render(segments, basename + ".vtt")
+    finally:
+        if cache_dir is not None:
+            set_cache_dir(previous_cache_dir)
@@ -1,7 +1,12 @@
 import re
 import io
-from bs4 import BeautifulSoup
-from typing import Union, List
+import html
+from typing import Union, List, Iterable, Optional
+
+TIMESTAMP = re.compile(r"\d\d:\d\d:\d\d")
+INLINE_TIMESTAMP = re.compile(r"<(\d\d:\d\d:\d\d(\.\d+)?)>")
+# html tags start with a letter, so inline timestamps are left alone
+TAG = re.compile(r"</?[a-zA-Z][^>]*>")
 
 
 def timestamp_to_secs(ts: str) -> float:
@@ -21,36 +26,55 @@ def secs_to_timestamp(secs: float) -> str:
     return "%02d:%02d:%02f" % (h, m, s)
 
 
-def parse_cued(data: List[str]) -> List[dict]:
-    out = []
-    pat = r"<(\d\d:\d\d:\d\d(\.\d+)?)>"
+def strip_tags(content: str) -> str:
+    """
+    Removes markup like <c> or <i> from the text of a cue, keeping inline
+    word timestamps
 
-    for lines in data:
-        meta, content = lines
-        start, end = meta.split(" --> ")
-        end = end.split(" ")[0]
-        start = timestamp_to_secs(start)
-        end = timestamp_to_secs(end)
-        text = BeautifulSoup(content, "html.parser").text
-        words = text.split(" ")
-        sentence = {"content": "", "words": []}
+    :param content str: Cue text
+    :rtype str: Plain text
+    """
+    return html.unescape(TAG.sub("", content))
+
+
+def parse_cue(meta: str, text: str) -> dict:
+    """
+    Parses a cue with inline word timestamps into a sentence
 
-        for word in words:
-            item = {}
-            item["start"] = start
-            item["end"] = end
-            word_parts = re.split(pat, word)
-            item["word"] = word_parts[0]
+    :param meta str: The cue's timing line
+    :param text str: The cue's text, without markup
+    :rtype dict: Sentence with words
+    """
+    start, end = meta.split(" --> ")
+    end = end.split(" ")[0]
+    start = timestamp_to_secs(start)
+    end = timestamp_to_secs(end)
+    words = text.split(" ")
+    sentence = {"content": "", "words": []}
+
+    for word in words:
+        item = {}
+        item["start"] = start
+        item["end"] = end
+        timestamp = INLINE_TIMESTAMP.search(word)
+
+        if timestamp is None:
+            item["word"] = word
+        else:
+            item["word"] = word[0 : timestamp.start()]
+            item["end"] = timestamp_to_secs(timestamp.group(1))
 
-            if len(word_parts) > 1:
-                item["end"] = timestamp_to_secs(word_parts[1])
+        sentence["words"].append(item)
+        start = item["end"]
 
-            sentence["words"].append(item)
-            start = item["end"]
+    sentence["content"] = " ".join([w["word"] for w in sentence["words"]])
+    return sentence
 
-        sentence["content"] = " ".join([w["word"] for w in sentence["words"]])
-        out.append(sentence)
 
+def join_cues(out: List[dict]) -> List[dict]:
+    """
+    Sets sentence times from their words, and trims words that overlap the next sentence
+    """
     for index, sentence in enumerate(out):
         if index == 0:
             sentence["start"] = sentence["words"][0]["start"]
@@ -69,24 +93,43 @@ def parse_cued(data: List[str]) -> List[dict]:
     return out
 
 
-def parse_uncued(data: str) -> List[dict]:
+def parse_cued(data: List[str]) -> List[dict]:
+    from bs4 import BeautifulSoup
+
     out = []
+
+    for lines in data:
+        meta, content = lines
+        text = BeautifulSoup(content, "html.parser").text
+        out.append(parse_cue(meta, text))
+
+    return join_cues(out)
+
+
+def add_uncued_line(out: List[dict], line: str):
+    """
+    Adds a line of a vtt file without word timestamps to a list of sentences
+    """
+    if " --> " in line:
+        start, end = line.split(" --> ")
+        end = end.split(" ")[0]
+        start = timestamp_to_secs(start)
+        end = timestamp_to_secs(end)
+        if out[-1]["start"] is None:
+            out[-1]["start"] = start
+            out[-1]["end"] = end
+        else:
+            out.append({"content": "", "start": start, "end": end})
+    else:
+        if out[-1]["start"] is not None:
+            out[-1]["content"] += " " + line.strip()
+
+
+def parse_uncued(data: str) -> List[dict]:
     lines = [d.strip() for d in data.split("\n") if d.strip() != ""]
     out = [{"content": "", "start": None, "end": None}]
     for line in lines:
-        if " --> " in line:
-            start, end = line.split(" --> ")
-            end = end.split(" ")[0]
-            start = timestamp_to_secs(start)
-            end = timestamp_to_secs(end)
-            if out[-1]["start"] is None:
-                out[-1]["start"] = start
-                out[-1]["end"] = end
-            else:
-                out.append({"content": "", "start": start, "end": end})
-        else:
-            if out[-1]["start"] is not None:
-                out[-1]["content"] += " " + line.strip()
+        add_uncued_line(out, line)
 
     for o in out:
         o["content"] = o["content"].strip()
@@ -94,12 +137,61 @@ def parse_uncued(data: str) -> List[dict]:
     return out
 
 
+def parse_stream(lines: Iterable[str]) -> List[dict]:
+    """
+    Parses webvtt one line at a time, for example straight from a file
+    handle, and returns timestamps for words and lines. Gives the same
+    output as parse_full(), without holding the whole file in memory or
+    parsing every cue as html.
+
+    :param lines Iterable[str]: Lines of the file
+    :rtype List[dict]: Sentences, with words if the file has inline word timestamps
+    """
+
+    cued = []
+    uncued = [{"content": "", "start": None, "end": None}]
+    previous: Optional[str] = None
+
+    for line in lines:
+        line = line.rstrip("\n")
+
+        if TIMESTAMP.search(line) is not None:
+            # cues with word timestamps come right after their timing line
+            if previous is not None and INLINE_TIMESTAMP.search(line) is not None:
+                cued.append(parse_cue(previous, strip_tags(line)))
+            previous = line
+
+        # only needed if the file turns out to have no word timestamps
+        if len(cued) == 0 and line.strip() != "":
+            add_uncued_line(uncued, line.strip())
+
+    if len(cued) > 0:
+        return join_cues(cued)
+
+    for o in uncued:
+        o["content"] = o["content"].strip()
+
+    return uncued
+
+
 def parse(vtt: Union[io.IOBase, str]) -> List[dict]:
     """
     Parses webvtt and returns timestamps for words and lines
     Tested on automatically generated subtitles from YouTube
     """
 
+    if isinstance(vtt, str):
+        vtt = io.StringIO(vtt)
+
+    return parse_stream(vtt)
+
+
+def parse_full(vtt: Union[io.IOBase, str]) -> List[dict]:
+    """
+    Parses webvtt in memory, stripping tags with BeautifulSoup.
+    Slower than parse(), which should be used instead.
+    """
+
     _vtt: str = ""
     if isinstance(vtt, io.IOBase):
         _vtt = vtt.read()